@@ -0,0 +1,79 @@
+"""
+base64与vmess链接解码的基准测试：对比原来的实现与现在的base64_decode、decode_vmess_payloads
+1. 整个订阅的base64解码
+2. 订阅中所有vmess链接的解码：原来的base64_decode后json.loads，与decode_vmess_payloads
+3. 解析只含vmess链接的v2订阅(sub_2_nodelist)
+
+python -m benchmarks.bench_decode [节点数 ...]
+"""
+import base64
+import json
+import os
+import sys
+import time
+
+from loguru import logger
+
+from benchmarks import corpus
+from core import config_model
+from core.config_model import decode_vmess_payloads
+from core.converter import sub_2_nodelist
+from core.helper import base64_decode
+
+
+def legacy_base64_decode(content):
+    # 之前的实现
+    content = content.strip().replace(os.linesep, '').replace('\r', '').replace('\n', '').replace(' ', '')
+
+    content_length = len(content)
+    if content_length % 4 != 0:
+        content = content.ljust(content_length + 4 - content_length % 4, "=")
+
+    return str(base64.b64decode(content), "utf-8").strip()
+
+
+def legacy_decode_vmess(payloads):
+    results = []
+    for payload in payloads:
+        try:
+            results.append(json.loads(legacy_base64_decode(payload)))
+        except:
+            results.append(None)
+    return results
+
+
+def timeit(func, *args, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(counts):
+    logger.remove()
+    json_impl = 'orjson' if config_model._json_loads is not json.loads else 'json'
+    print(f'vmess json解析: {json_impl}')
+
+    print(f'{"节点数":>8} {"阶段":>22} {"原实现(s)":>10} {"新实现(s)":>10} {"加速":>6}')
+    for count in counts:
+        links = corpus.links(count, 'vmess')
+        sub = corpus.v2_sub(count)
+        payloads = [i[len('vmess://'):] for i in links]
+        assert decode_vmess_payloads(payloads) == legacy_decode_vmess(payloads)
+
+        rows = [
+            ('订阅base64', timeit(legacy_base64_decode, sub), timeit(base64_decode, sub)),
+            ('vmess链接解码', timeit(legacy_decode_vmess, payloads), timeit(decode_vmess_payloads, payloads)),
+        ]
+        for name, legacy, current in rows:
+            print(f'{count:>8} {name:>22} {legacy:>10.4f} {current:>10.4f} {legacy / current:>5.1f}x')
+
+        vmess_sub = base64.b64encode('\n'.join(links).encode('utf-8')).decode('ascii')
+        print(f'{count:>8} {"解析vmess订阅":>22} {"":>10} {timeit(sub_2_nodelist, vmess_sub, repeat=3):>10.4f}')
+
+
+if __name__ == '__main__':
+    main([int(i) for i in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,55 @@
+"""
+重名节点分配名称的基准测试：所有节点同名，验证生成订阅的耗时随节点数线性增长
+
+python -m benchmarks.bench_names [节点数 ...]
+"""
+import sys
+import time
+
+from loguru import logger
+
+from core.config_model import ProxyNode
+from core.converter import generate_sub
+from core.helper import NameAllocator
+
+
+def make_nodes(count):
+    nodes = []
+    for i in range(count):
+        pn = ProxyNode()
+        pn.load({'name': 'same-name', 'type': 'ss', 'server': 'bench.example.com', 'port': 10000 + i % 50000,
+                 'cipher': 'aes-128-gcm', 'password': 'password'})
+        nodes.append(pn)
+    return nodes
+
+
+def bench_allocator(count):
+    allocator = NameAllocator()
+    start = time.perf_counter()
+    for _ in range(count):
+        allocator.allocate('same-name')
+    return time.perf_counter() - start
+
+
+def bench_render(nodes, client):
+    start = time.perf_counter()
+    generate_sub(nodes, client)
+    return time.perf_counter() - start
+
+
+def main(counts):
+    logger.remove()
+
+    print(f'{"节点数":>8} {"阶段":>12} {"总耗时(s)":>10} {"每节点(us)":>10}')
+    for count in counts:
+        elapsed = bench_allocator(count)
+        print(f'{count:>8} {"allocator":>12} {elapsed:>10.3f} {elapsed / count * 1e6:>10.2f}')
+
+        nodes = make_nodes(count)
+        for client in ('Surfboard', 'Leaf', 'Clash'):
+            elapsed = bench_render(nodes, client)
+            print(f'{count:>8} {client:>12} {elapsed:>10.3f} {elapsed / count * 1e6:>10.2f}')
+
+
+if __name__ == '__main__':
+    main([int(i) for i in sys.argv[1:]] or [1000, 10000, 100000])
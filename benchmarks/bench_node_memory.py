@@ -0,0 +1,55 @@
+"""
+ProxyNode内存占用基准测试：加载多协议节点后统计每个节点占用的内存
+
+python -m benchmarks.bench_node_memory [节点数]
+"""
+import gc
+import sys
+import tracemalloc
+
+from loguru import logger
+
+from core.config_model import ProxyNode
+
+LINKS = [
+    'ss://YWVzLTI1Ni1nY206cGFzc3dvcmQ=@{i}.ss.example.com:8388#ss-{i}',
+    'vmess://eyJ2IjogIjIiLCAicHMiOiAidm1lc3MiLCAiYWRkIjogInZtZXNzLmV4YW1wbGUuY29tIiwgInBvcnQiOiAiNDQzIiwgImlkIjogImI4MzFhMTRlLTZkNjgtNGIzOC05YTEwLTRlMTJlYTc2YWQ1NCIsICJhaWQiOiAiMCIsICJuZXQiOiAid3MiLCAidHlwZSI6ICJub25lIiwgImhvc3QiOiAidm1lc3MuZXhhbXBsZS5jb20iLCAicGF0aCI6ICIvd3MiLCAidGxzIjogInRscyJ9',
+    'trojan://password-{i}@{i}.trojan.example.com:443?sni=trojan.example.com#trojan-{i}',
+    'vless://b831a14e-6d68-4b38-9a10-4e12ea76ad54@{i}.vless.example.com:443?path=%2Fws&security=tls&encryption=none&type=ws#vless-{i}',
+]
+
+
+def load_nodes(count):
+    nodes = []
+    for i in range(count):
+        pn = ProxyNode()
+        if pn.load(LINKS[i % len(LINKS)].format(i=i)):
+            nodes.append(pn)
+    return nodes
+
+
+def object_size(node):
+    # 对象本身及其__dict__(如有)占用的内存，不含属性引用的字符串
+    size = sys.getsizeof(node)
+    if hasattr(node, '__dict__'):
+        size += sys.getsizeof(node.__dict__)
+    return size
+
+
+def main(count):
+    logger.remove()
+
+    gc.collect()
+    tracemalloc.start()
+    nodes = load_nodes(count)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'节点数: {len(nodes)}')
+    print(f'总内存: {current / 1024 / 1024:.2f} MiB, 峰值: {peak / 1024 / 1024:.2f} MiB')
+    print(f'每节点: {current / len(nodes):.0f} B (其中对象本身 {object_size(nodes[0])} B)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,114 @@
+"""
+解析与生成订阅的基准测试集：使用benchmarks.corpus生成的合成订阅，分别统计
+1. sub_2_nodelist解析v2订阅、clash订阅
+2. ProxyNode.load按协议逐个加载分享链接、clash节点
+3. generate_sub生成四种客户端的订阅，免流(ml)与非免流各一次
+
+结果保存为json，传入--baseline时与上次的结果对比，耗时增加超过--threshold即视为退化，退出码为1
+
+python -m benchmarks.bench_suite [--sizes 1000,10000,100000] [--output 结果.json] [--baseline 上次结果.json]
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from typing import Callable, Dict
+
+from loguru import logger
+
+from benchmarks import corpus
+from core.config_model import ProxyNode
+from core.converter import generate_sub, sub_2_nodelist
+
+CLIENTS = ('Clash', 'v2rayN', 'Leaf', 'Surfboard')
+
+
+def timeit(func: Callable, repeat: int) -> float:
+    # 取多次中的最小值，减少其他进程的干扰
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def load_all(items):
+    for i in items:
+        ProxyNode().load(i)
+
+
+def run(sizes, repeat) -> Dict[str, float]:
+    results = {}
+
+    def record(name, func):
+        results[name] = timeit(func, repeat)
+        print(f'{name:<40} {results[name]:.4f}s')
+
+    for size in sizes:
+        v2_content = corpus.v2_sub(size)
+        clash_content = corpus.clash_sub(size)
+        record(f'sub_2_nodelist/v2/{size}', lambda: sub_2_nodelist(v2_content))
+        record(f'sub_2_nodelist/clash/{size}', lambda: sub_2_nodelist(clash_content))
+
+        for scheme in corpus.SCHEMES:
+            links = corpus.links(size, scheme)
+            record(f'load/{scheme}/{size}', lambda: load_all(links))
+        proxies = corpus.clash_proxies(size)
+        record(f'load/clash/{size}', lambda: load_all(proxies))
+
+        nodes = sub_2_nodelist(v2_content) + sub_2_nodelist(clash_content)
+        for client in CLIENTS:
+            for ml in (False, True):
+                record(f'generate_sub/{client}/{"ml" if ml else "plain"}/{size}',
+                       lambda: generate_sub(nodes, client, ml))
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], threshold: float) -> bool:
+    regressed = False
+    for name, old in baseline.items():
+        new = results.get(name)
+        if new is None or not old:
+            continue
+        change = new / old - 1
+        if change > threshold:
+            regressed = True
+            print(f'退化 {name}: {old:.4f}s -> {new:.4f}s (+{change:.0%})')
+    return not regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='解析与生成订阅的基准测试')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='节点数，逗号分隔')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最小值')
+    parser.add_argument('--output', help='保存结果的json文件')
+    parser.add_argument('--baseline', help='用于对比的上次结果json文件')
+    parser.add_argument('--threshold', type=float, default=0.2, help='耗时增加超过该比例视为退化')
+    args = parser.parse_args()
+
+    logger.remove()
+
+    results = run([int(i) for i in args.sizes.split(',')], args.repeat)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'results': results
+            }, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        if not compare(results, baseline, args.threshold):
+            sys.exit(1)
+        print(f'与{args.baseline}相比无退化')
+
+
+if __name__ == '__main__':
+    main()
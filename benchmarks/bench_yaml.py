@@ -0,0 +1,69 @@
+"""
+Clash订阅yaml解析/生成基准测试：对比纯python实现与libyaml(C)实现
+
+python -m benchmarks.bench_yaml [代理数] [规则数]
+"""
+import sys
+import time
+
+import yaml
+
+
+def make_clash_sub(proxy_count, rule_count):
+    proxies = []
+    for i in range(proxy_count):
+        proxies.append({
+            'name': f'🇭🇰 香港 {i:05d}', 'type': 'vmess', 'server': f'node{i}.example.com', 'port': 443,
+            'uuid': 'b831a14e-6d68-4b38-9a10-4e12ea76ad54', 'alterId': 0, 'cipher': 'auto', 'tls': True,
+            'skip-cert-verify': True, 'network': 'ws',
+            'ws-opts': {'path': f'/ws/{i}', 'headers': {'Host': f'cdn{i % 10}.example.com'}}, 'udp': True
+        })
+    names = [i['name'] for i in proxies]
+    rules = [f'DOMAIN-SUFFIX,site{i}.example.com,{"DIRECT" if i % 3 else "Proxy"}' for i in range(rule_count)]
+    rules.append('MATCH,Proxy')
+    return {
+        'port': 7890,
+        'proxies': proxies,
+        'proxy-groups': [{'name': 'Proxy', 'type': 'select', 'proxies': names},
+                         {'name': 'Auto', 'type': 'url-test', 'proxies': names,
+                          'url': 'http://www.gstatic.com/generate_204', 'interval': 300}],
+        'rules': rules
+    }
+
+
+def timeit(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(proxy_count, rule_count):
+    data = make_clash_sub(proxy_count, rule_count)
+    content = yaml.dump(data, allow_unicode=True)
+    print(f'代理数: {proxy_count}, 规则数: {rule_count}, 订阅大小: {len(content.encode()) / 1024 / 1024:.2f} MiB')
+
+    paths = [('python', yaml.FullLoader, yaml.Dumper)]
+    if yaml.__with_libyaml__:
+        paths.append(('libyaml', yaml.CFullLoader, yaml.CDumper))
+    else:
+        print('PyYAML未编译libyaml，仅测试纯python实现')
+
+    results = {}
+    for name, loader, dumper in paths:
+        load_time, loaded = timeit(lambda: yaml.load(content, Loader=loader))
+        dump_time, dumped = timeit(lambda: yaml.dump(data, Dumper=dumper))
+        results[name] = (load_time, dump_time)
+        assert loaded == data and yaml.load(dumped, Loader=yaml.FullLoader) == data, f'{name}结果不一致'
+        print(f'{name:>8}  load: {load_time:.3f}s  dump: {dump_time:.3f}s')
+
+    if 'libyaml' in results:
+        (py_load, py_dump), (c_load, c_dump) = results['python'], results['libyaml']
+        print(f' speedup  load: x{py_load / c_load:.1f}  dump: x{py_dump / c_dump:.1f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000, int(sys.argv[2]) if len(sys.argv) > 2 else 20000)
@@ -0,0 +1,116 @@
+"""
+基准测试用的合成订阅：按固定随机种子生成，同样的参数每次生成的内容相同
+
+python -m benchmarks.corpus [节点数]  打印各协议的示例链接
+"""
+import base64
+import json
+import random
+import sys
+from typing import Dict, List
+
+import yaml
+
+SCHEMES = ('ss', 'ssr', 'vmess', 'trojan', 'vless')
+
+_NAMES = ('🇭🇰 香港', '🇯🇵 日本', '🇺🇸 美国', 'SG 新加坡', 'TW-台湾')
+
+
+def _b64(s: str) -> str:
+    return base64.b64encode(s.encode('utf-8')).decode('ascii')
+
+
+def _urlsafe_b64(s: str) -> str:
+    return base64.urlsafe_b64encode(s.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _server(r: random.Random, i: int) -> str:
+    if r.random() < 0.3:
+        return f'{r.randint(11, 120)}.{r.randint(1, 250)}.{r.randint(1, 250)}.{r.randint(1, 250)}'
+    return f'node{i}.example{r.randint(0, 9)}.com'
+
+
+def _name(r: random.Random, i: int) -> str:
+    return f'{r.choice(_NAMES)} {i:06d}'
+
+
+def _ss(r: random.Random, i: int) -> str:
+    cipher = r.choice(['aes-256-gcm', 'aes-128-gcm', 'chacha20-ietf-poly1305'])
+    return f'ss://{_b64(f"{cipher}:password{i}")}@{_server(r, i)}:{r.randint(1000, 60000)}#{_name(r, i)}'
+
+
+def _ssr(r: random.Random, i: int) -> str:
+    # 与常见的ssr链接一致，外层整体与内层参数均使用不带填充的urlsafe base64
+    params = (f'remarks={_urlsafe_b64(_name(r, i))}&protoparam={_urlsafe_b64("100:pp")}'
+              f'&obfsparam={_urlsafe_b64("obfs.com")}')
+    body = (f'{_server(r, i)}:{r.randint(1000, 60000)}:auth_aes128_md5:chacha20-ietf:http_simple:'
+            f'{_urlsafe_b64(f"password{i}")}/?{params}')
+    return 'ssr://' + _urlsafe_b64(body)
+
+
+def _vmess(r: random.Random, i: int) -> str:
+    network = r.choice(['ws', 'tcp', 'grpc'])
+    config = {
+        'v': '2', 'ps': _name(r, i), 'add': _server(r, i), 'port': str(r.randint(1000, 60000)),
+        'id': f'b831a14e-6d68-4b38-9a10-{i:012d}', 'aid': '0', 'net': network, 'type': 'none',
+        'host': f'cdn{i % 10}.example.com' if network == 'ws' else '', 'path': f'/ws/{i}' if network == 'ws' else '',
+        'tls': r.choice(['', 'tls'])
+    }
+    return 'vmess://' + _b64(json.dumps(config, ensure_ascii=False))
+
+
+def _trojan(r: random.Random, i: int) -> str:
+    query = r.choice(['', '?sni=trojan.example.com', '?security=tls&type=ws&host=h.example.com&allowInsecure=1'])
+    return f'trojan://password{i}@{_server(r, i)}:443{query}#{_name(r, i)}'
+
+
+def _vless(r: random.Random, i: int) -> str:
+    return (f'vless://b831a14e-6d68-4b38-9a10-{i:012d}@{_server(r, i)}:443?path=%2Fws&security=tls'
+            f'&encryption=none&type=ws&host=h.example.com&sni=s.example.com#{_name(r, i)}')
+
+
+_LINK_MAKERS = {'ss': _ss, 'ssr': _ssr, 'vmess': _vmess, 'trojan': _trojan, 'vless': _vless}
+
+
+def links(count: int, scheme: str = None, seed: int = 1) -> List[str]:
+    """
+    生成count个分享链接，scheme为None时各协议轮流出现
+    """
+    r = random.Random(seed)
+    makers = [_LINK_MAKERS[scheme]] if scheme else [_LINK_MAKERS[i] for i in SCHEMES]
+    return [makers[i % len(makers)](r, i) for i in range(count)]
+
+
+def v2_sub(count: int, seed: int = 1) -> str:
+    return _b64('\n'.join(links(count, seed=seed)))
+
+
+def clash_proxies(count: int, seed: int = 2) -> List[Dict]:
+    r = random.Random(seed)
+    proxies = []
+    for i in range(count):
+        kind = i % 4
+        common = {'name': _name(r, i), 'server': _server(r, i), 'port': r.randint(1000, 60000)}
+        if kind == 0:
+            proxies.append({**common, 'type': 'ss', 'cipher': 'aes-128-gcm', 'password': f'password{i}', 'udp': True})
+        elif kind == 1:
+            proxies.append({**common, 'type': 'ssr', 'cipher': 'chacha20-ietf', 'password': f'password{i}',
+                            'obfs': 'http_simple', 'protocol': 'auth_aes128_md5'})
+        elif kind == 2:
+            proxies.append({**common, 'type': 'vmess', 'uuid': f'b831a14e-6d68-4b38-9a10-{i:012d}', 'alterId': 0,
+                            'cipher': 'auto', 'tls': True, 'network': 'ws',
+                            'ws-opts': {'path': f'/ws/{i}', 'headers': {'Host': f'cdn{i % 10}.example.com'}}})
+        else:
+            proxies.append({**common, 'type': 'trojan', 'password': f'password{i}', 'sni': 'trojan.example.com',
+                            'skip-cert-verify': True})
+    return proxies
+
+
+def clash_sub(count: int, seed: int = 2) -> str:
+    return yaml.dump({'proxies': clash_proxies(count, seed), 'rules': ['MATCH,DIRECT']}, allow_unicode=True)
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    for s in SCHEMES:
+        print('\n'.join(links(n, s)))
@@ -0,0 +1,407 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from requests import Timeout
+
+from core import metrics
+from core.compress import base_etag
+from core.singleflight import SingleFlight
+
+
+class LRUCache(object):
+    """
+    线程安全的LRU缓存，同时限制条目数和总字节数，任一超出即淘汰最久未使用的条目
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._data = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            self._data.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, size: int = 0):
+        with self._lock:
+            if self.max_bytes is not None and size > self.max_bytes:
+                # 单个条目超过总预算，不缓存
+                self.pop(key)
+                return
+
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._data[key] = (value, size)
+            self._bytes += size
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return default
+            self._bytes -= item[1]
+            return item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _evict(self):
+        while self._data and (
+                (self.max_entries is not None and len(self._data) > self.max_entries) or
+                (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            _, (_, size) = self._data.popitem(last=False)
+            self._bytes -= size
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+def fingerprint(content: str) -> str:
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+# 估算的每个解析后节点占用的内存，用于缓存的字节数统计
+NODE_BYTES = 512
+
+
+def max_age(headers) -> Optional[int]:
+    """
+    上游声明的更新间隔(秒)：Cache-Control的max-age，或订阅常用的profile-update-interval(小时)
+    """
+    for directive in headers.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name.lower() == 'max-age' and value.isdigit():
+            return int(value)
+
+    interval = headers.get('profile-update-interval', '')
+    if interval.isdigit():
+        return int(interval) * 3600
+    return None
+
+
+class FetchEntry(object):
+    # nodes: 内容解析后的节点，未解析时为None；max_age: 上游声明的更新间隔(秒)
+    __slots__ = ('content', 'fingerprint', 'etag', 'last_modified', 'fetched_at', 'refreshing', 'nodes', 'size',
+                 'max_age')
+
+    def __init__(self, content: str, etag: Optional[str], last_modified: Optional[str], fetched_at: float):
+        self.content = content
+        self.fingerprint = fingerprint(content)
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.refreshing = False
+        self.nodes = None
+        self.size = len(content.encode('utf-8'))
+        self.max_age = None
+
+
+class FetchCache(object):
+    """
+    订阅内容缓存，按订阅url缓存
+    1. ttl内直接返回缓存
+    2. 过期但未超过max_stale时返回旧内容，同时在后台刷新(stale-while-revalidate)
+    3. 刷新时带上ETag/Last-Modified发起条件请求，304时只更新时间
+    4. 上游出错时返回上次成功获取的内容
+    5. 传入store时，内存中没有的订阅先从store中读取，获取到的内容和解析后的节点写入store
+       读取在调用线程中直接执行；写入可能等待其他worker释放锁，放在store_executor中执行，不占用获取订阅的线程
+    """
+
+    def __init__(self, get: Callable[..., Any], ttl: float, max_stale: float, max_bytes: int,
+                 executor: Optional[Executor] = None, store=None, store_executor: Optional[Executor] = None):
+        self._get = get
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._executor = executor
+        self._store = store
+        self._store_executor = store_executor
+
+        self._entries = LRUCache(max_bytes=max_bytes)
+        self._lock = threading.Lock()
+        # 同一url同时只向上游发起一个请求
+        self._inflight = SingleFlight()
+
+    def __call__(self, url: str) -> str:
+        return self.get(url).content
+
+    def get(self, url: str, ttl: Optional[float] = None) -> FetchEntry:
+        """
+        ttl: 本次使用的缓存有效期，默认为self.ttl
+        """
+        if ttl is None:
+            ttl = self.ttl
+
+        entry = self._entries.get(url)
+        if self._store is not None and (entry is None or time.time() - entry.fetched_at >= ttl):
+            # 本进程中没有或已过期时，先看store中是否有其他worker获取的更新内容
+            entry = self._load_stored(url, entry) or entry
+        if entry:
+            age = time.time() - entry.fetched_at
+            if age < ttl:
+                logger.debug(f'订阅缓存命中: {url}')
+                metrics.CACHE_REQUESTS.labels('fetch', 'hit').inc()
+                return entry
+            if age < ttl + self.max_stale and self._executor is not None:
+                logger.debug(f'订阅缓存已过期，先返回旧内容并后台刷新: {url}')
+                metrics.CACHE_REQUESTS.labels('fetch', 'stale').inc()
+                self._refresh_in_background(url, entry)
+                return entry
+
+        metrics.CACHE_REQUESTS.labels('fetch', 'miss').inc()
+        return self._fetch(url, entry)
+
+    def refresh(self, url: str, min_age: float = 0) -> FetchEntry:
+        """
+        不论是否过期都向上游发起(条件)请求，供后台定时刷新使用
+        min_age: 其他worker在这段时间内已刷新过时直接使用其结果
+        """
+        entry = self._entries.get(url)
+        if self._store is not None:
+            entry = self._load_stored(url, entry) or entry
+        if entry and time.time() - entry.fetched_at < min_age:
+            return entry
+        return self._fetch(url, entry)
+
+    def get_nodes(self, url: str, entry: FetchEntry) -> Optional[List]:
+        """
+        entry内容解析后的节点，内存和store中都没有时返回None，由调用方解析后通过set_nodes保存
+        """
+        if entry.nodes is None and self._store is not None:
+            nodes = self._persist(self._store.load_nodes, url, entry.fingerprint)
+            if nodes is not None:
+                self._set_nodes(url, entry, nodes)
+        return entry.nodes
+
+    def set_nodes(self, url: str, entry: FetchEntry, nodes: List):
+        self._set_nodes(url, entry, nodes)
+        if self._store is not None:
+            self._persist_later(self._store.save_nodes, url, entry.fingerprint, nodes)
+
+    def _set_nodes(self, url: str, entry: FetchEntry, nodes: List):
+        entry.nodes = nodes
+        # 只有仍在缓存中的entry才需要更新占用的字节数
+        if self._entries.get(url) is entry:
+            self._entries.set(url, entry, entry.size + len(nodes) * NODE_BYTES)
+
+    def _load_stored(self, url: str, current: Optional[FetchEntry] = None) -> Optional[FetchEntry]:
+        # 只读取比current更新的内容
+        entry = self._persist(self._store.load, url, current.fetched_at if current else 0)
+        if entry:
+            logger.debug(f'从本地存储读取订阅: {url}')
+            if current is not None and current.fingerprint == entry.fingerprint:
+                entry.nodes = current.nodes
+            self._entries.set(url, entry, entry.size + len(entry.nodes or ()) * NODE_BYTES)
+        return entry
+
+    def _persist(self, func: Callable, *args):
+        # 本地存储出错不影响正常获取订阅
+        try:
+            return func(*args)
+        except Exception as e:
+            logger.error(f'读写本地订阅存储出错: {e}')
+            return None
+
+    def _persist_later(self, func: Callable, *args):
+        if self._store_executor is not None:
+            self._store_executor.submit(self._persist, func, *args)
+        else:
+            self._persist(func, *args)
+
+    def _refresh_in_background(self, url: str, entry: FetchEntry):
+        with self._lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+
+        def refresh():
+            try:
+                self._fetch(url, entry)
+            except Exception as e:
+                logger.error(f'后台刷新订阅出错: {url} {e}')
+            finally:
+                entry.refreshing = False
+
+        self._executor.submit(refresh)
+
+    def _fetch(self, url: str, entry: Optional[FetchEntry]) -> FetchEntry:
+        return self._inflight.do(url, self._fetch_upstream, url, entry)
+
+    def _fetch_upstream(self, url: str, entry: Optional[FetchEntry]) -> FetchEntry:
+        headers = {}
+        if entry:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        host = metrics.host_label(url)
+        try:
+            with metrics.FETCH_SECONDS.labels(host).time():
+                res = self._get(url, headers=headers)
+            if res.status_code == 304 and entry:
+                logger.debug(f'订阅未修改(304): {url}')
+                entry.fetched_at = time.time()
+                entry.max_age = max_age(res.headers) or entry.max_age
+                if self._store is not None:
+                    self._persist_later(self._store.touch, url, entry.fetched_at, entry.max_age)
+                return entry
+            res.raise_for_status()
+
+            content = res.text.strip()
+            if not content:
+                raise ValueError('订阅内容为空')
+        except Exception as e:
+            metrics.FETCH_ERRORS.labels(host, 'timeout' if isinstance(e, Timeout) else 'error').inc()
+            if entry:
+                logger.warning(f'获取订阅出错，使用上次成功获取的内容: {url} {e}')
+                return entry
+            raise
+
+        new_entry = FetchEntry(content, res.headers.get('ETag'), res.headers.get('Last-Modified'), time.time())
+        new_entry.max_age = max_age(res.headers)
+        if entry is not None and entry.fingerprint == new_entry.fingerprint and entry.nodes is not None:
+            # 内容未变化(上游不支持条件请求时)，沿用已解析的节点
+            new_entry.nodes = entry.nodes
+        self._entries.set(url, new_entry, new_entry.size + len(new_entry.nodes or ()) * NODE_BYTES)
+        if self._store is not None:
+            self._persist_later(self._store.save, url, new_entry)
+        return new_entry
+
+
+class RenderCache(object):
+    """
+    渲染缓存：本进程的LRU缓存 + 所有worker共享的store
+    本进程未命中时从store读取，写入时先写本进程缓存，再在executor中写入store
+    get_local只查本进程缓存，可在事件循环中调用；get可能读取store，需在线程池中调用
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, store=None, executor: Optional[Executor] = None):
+        self._local = LRUCache(max_entries, max_bytes)
+        self._store = store
+        self._executor = executor
+
+    @property
+    def shared(self) -> bool:
+        return self._store is not None
+
+    def get_local(self, key: str) -> Optional['RenderedSub']:
+        return self._local.get(key)
+
+    def get(self, key: str) -> Optional['RenderedSub']:
+        rendered = self._local.get(key)
+        if rendered is not None or self._store is None:
+            return rendered
+
+        try:
+            row = self._store.load_rendered(key)
+        except Exception as e:
+            logger.error(f'读取共享渲染缓存出错: {e}')
+            return None
+        if row is None:
+            return None
+        rendered = RenderedSub(*row)
+        self._local.set(key, rendered, rendered.size)
+        return rendered
+
+    def set(self, key: str, rendered: 'RenderedSub'):
+        size = rendered.size
+        self._local.set(key, rendered, size)
+        if self._store is not None:
+            if self._executor is not None:
+                self._executor.submit(self._save, key, rendered, size)
+            else:
+                self._save(key, rendered, size)
+
+    def _save(self, key: str, rendered: 'RenderedSub', size: int):
+        try:
+            self._store.save_rendered(key, rendered.body, rendered.headers, rendered.providers, rendered.encoded,
+                                      size)
+        except Exception as e:
+            logger.error(f'写入共享渲染缓存出错: {e}')
+
+
+class RenderedSub(object):
+    """
+    渲染完成的订阅：最终返回的body和headers
+    providers: 渲染时用到的clash proxy-providers，{url: (interval, 内容指纹)}，命中缓存时需确认其内容未变化
+    encoded: body按各编码压缩后的内容，{编码: 压缩后的body}，每次命中直接返回，不再压缩
+    """
+    __slots__ = ('body', 'headers', 'providers', 'encoded')
+
+    def __init__(self, body: str, headers: Dict[str, str], providers: Dict[str, Tuple[Optional[int], str]] = None,
+                 encoded: Dict[str, bytes] = None):
+        self.body = body
+        self.headers = headers
+        self.providers = providers
+        self.encoded = encoded or {}
+
+    @property
+    def size(self):
+        return len(self.body.encode('utf-8')) + sum(len(k) + len(v) for k, v in self.headers.items()) + \
+            sum(len(i) for i in self.encoded.values())
+
+
+def render_key(inputs: Iterable[str], fingerprints: Iterable[Optional[str]], *params: Optional[str]) -> str:
+    """
+    渲染缓存的key：用户输入 + 各订阅内容指纹 + 渲染参数，订阅内容变化时key随之变化，缓存自动失效
+    """
+    h = hashlib.sha256()
+    for part in (*inputs, '', *(i or '-' for i in fingerprints), '', *(i or '' for i in params)):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def sub_etag(key: str, providers: Dict[str, Tuple[Optional[int], str]] = None) -> str:
+    """
+    订阅的强ETag：没有用到proxy-providers时即为渲染缓存的key，不必渲染即可比较；
+    否则结果还取决于各provider的内容，需加上其内容指纹
+    """
+    if not providers:
+        return f'"{key}"'
+    h = hashlib.sha256(key.encode('utf-8'))
+    for url in sorted(providers):
+        h.update(b'\0' + url.encode('utf-8') + b'\0' + providers[url][1].encode('utf-8'))
+    return f'"p-{h.hexdigest()}"'
+
+
+def matching_etag(if_none_match: Optional[str], etag: Optional[str]) -> Optional[str]:
+    """
+    返回If-None-Match中与etag匹配的ETag(客户端持有的表示)，不匹配时返回None
+    使用弱比较：忽略W/前缀，可包含多个ETag或为*；同一内容的各压缩编码视为匹配
+    """
+    if not if_none_match or not etag:
+        return None
+    for i in if_none_match.split(','):
+        i = i.strip()
+        if i == '*':
+            return etag
+        if i.startswith('W/'):
+            i = i[2:]
+        if base_etag(i) == etag:
+            return i
+    return None
@@ -0,0 +1,101 @@
+import gzip
+import zlib
+from typing import Dict, Iterable, Iterator, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP = 'gzip'
+BROTLI = 'br'
+# 服务端支持的编码，按优先顺序，安装了brotli时优先使用br
+ENCODINGS = (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+
+def negotiate(accept_encoding: Optional[str], available: Iterable[str] = ENCODINGS) -> Optional[str]:
+    """
+    根据Accept-Encoding选择响应使用的编码，q值相同时按ENCODINGS的顺序，都不可接受时返回None(不压缩)
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        if encoding not in available:
+            continue
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """
+    level: gzip为压缩等级(1~9)，brotli为quality(0~11)
+    """
+    if encoding == GZIP:
+        # mtime固定为0，相同内容压缩结果相同
+        return gzip.compress(data, 6 if level is None else level, mtime=0)
+    if encoding == BROTLI:
+        return brotli.compress(data, quality=5 if level is None else level)
+    raise ValueError(f'不支持的编码: {encoding}')
+
+
+def compress_all(data: bytes, min_size: int = 0, levels: Dict[str, int] = None) -> Dict[str, bytes]:
+    """
+    用所有支持的编码压缩一次，结果与原内容一同缓存；小于min_size的内容不压缩
+    """
+    if len(data) < min_size:
+        return {}
+    levels = levels or {}
+    return {i: compress(data, i, levels.get(i)) for i in ENCODINGS}
+
+
+def compress_stream(chunks: Iterator[str], encoding: str, level: Optional[int] = None) -> Iterator[bytes]:
+    """
+    流式响应边生成边压缩
+    """
+    if encoding == GZIP:
+        compressor = zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+    elif encoding == BROTLI:
+        compressor = brotli.Compressor(quality=5 if level is None else level)
+        process, finish = compressor.process, compressor.finish
+    else:
+        raise ValueError(f'不支持的编码: {encoding}')
+
+    for chunk in chunks:
+        data = process(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield finish()
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """
+    同一内容不同编码的表示需要不同的强ETag
+    """
+    if not encoding:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def base_etag(etag: str) -> str:
+    for encoding in (BROTLI, GZIP):
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
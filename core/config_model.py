@@ -1,14 +1,98 @@
 import json
 import os
 import re
+import sys
+import time
 import urllib.parse
+from typing import List, Optional
+from urllib.parse import unquote
 
 from loguru import logger
 
-from core.helper import base64_encode, check_ip, base64_decode
+from core.helper import base64_encode, check_ip, base64_decode, base64_decode_bytes
+from core.stats import ParseStats, PARSED, INVALID_IP, UNSUPPORTED, INVALID, UNKNOWN_PARAM, INSECURE_FLAG, \
+    MALFORMED_PORT
+
+try:
+    # 安装了orjson时用其解析vmess链接中的json，比标准库快数倍
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+
+_TROJAN_SPLIT = re.compile(r'[:@#]')
+_VLESS_SPLIT = re.compile(r'[@:]')
+_DIGITS = re.compile(r'\d+')
+
+# 链接?后面的参数名 -> 节点属性
+_SSR_PARAMS = {
+    'remarks': 'name',
+    'protoparam': 'clash_ssr_protocol_param',
+    'obfsparam': 'clash_ssr_obfs_param'
+}
+_TROJAN_PARAMS = {
+    'peer': 'peer',
+    'sni': 'sni',
+    'security': 'security',
+    'type': 'network',
+    'encryption': 'encryption',
+    'flow': 'flow',
+    'headerType': 'type',
+    'host': 'host',
+    'alpn': 'alpn',
+    'allowInsecure': 'skip_cert_verify'
+}
+_VLESS_PARAMS = {
+    'path': 'path',
+    'security': 'tls',
+    'encryption': 'encryption',
+    'type': 'network',
+    'sni': 'sni',
+    'flow': 'flow',
+    'alpn': 'alpn',
+    'host': 'host',
+    'headerType': 'type'
+}
+
+
+def _note(stats: Optional[ParseStats], issue: str, message: str, *args):
+    # 链接中不影响加载的问题只计入stats，每次转换汇总打印一次；逐个节点的详情只在DEBUG级别打印
+    if stats is not None:
+        stats.note(issue)
+    logger.debug(message, *args)
+
+
+def _parse_params(params, names):
+    """
+    一次遍历解析a=1&b=2形式的参数，返回({节点属性: 值}, [未识别的参数])
+    """
+    fields = {}
+    unknown = []
+    for pair in params.split('&'):
+        key, sep, value = pair.partition('=')
+        field = names.get(key) if sep else None
+        if field:
+            fields[field] = value
+        else:
+            unknown.append(pair)
+    return fields, unknown
+
+
+# name、address基本各不相同，不做驻留
+_INTERNED_FIELDS = (
+    'protocol', 'port', 'v', 'encryption', 'password', 'uuid', 'alter_id', 'security', 'network', 'type', 'host',
+    'path', 'sni', 'flow', 'alpn', 'peer', 'clash_ssr_obfs', 'clash_ssr_protocol', 'clash_ssr_obfs_param',
+    'clash_ssr_protocol_param'
+)
 
 
 class ProxyNode(object):
+    # 所有节点会同时驻留内存，使用__slots__去掉每个实例的__dict__
+    __slots__ = (
+        'protocol', 'name', 'address', 'port', 'v', 'encryption', 'password', 'uuid', 'alter_id', 'security',
+        'network', 'type', 'host', 'path', 'tls', 'sni', 'udp', 'skip_cert_verify', 'flow', 'alpn', 'peer',
+        'clash_ssr_obfs', 'clash_ssr_protocol', 'clash_ssr_obfs_param', 'clash_ssr_protocol_param'
+    )
 
     def __init__(self):
         self.protocol = None
@@ -53,165 +137,49 @@ class ProxyNode(object):
 
         # v2rayN 分享链接格式：https://github.com/2dust/v2rayN/wiki/%E5%88%86%E4%BA%AB%E9%93%BE%E6%8E%A5%E6%A0%BC%E5%BC%8F%E8%AF%B4%E6%98%8E(ver-2)
 
-    def load(self, proxy_node):
-        logger.info(f'加载节点--> {proxy_node}')
+    def load(self, proxy_node, stats: ParseStats = None, decoded: dict = None):
+        """
+        decoded: vmess链接预先批量解码得到的json(见decode_vmess_payloads)，为None时由本方法解码
+        """
+        # 默认不再逐个节点打印日志，由stats汇总计数，需要时按比例抽样打印
+        sampled = stats is not None and stats.sampled()
+        if sampled:
+            logger.info('加载节点--> {}', proxy_node)
+
+        start = time.perf_counter()
+        result = self._load(proxy_node, decoded, stats)
+        if stats is not None:
+            stats.add(result, time.perf_counter() - start)
+
+        if result != PARSED:
+            if sampled:
+                logger.info('节点未加载({}): {}', result, proxy_node)
+            else:
+                logger.debug('节点未加载({}): {}', result, proxy_node)
+        return result == PARSED
+
+    def _load(self, proxy_node, decoded=None, stats=None):
         if isinstance(proxy_node, str) and '://' in proxy_node:
             proxy_node = proxy_node.replace('\r', '').replace('\n', '')
             part1, part2 = proxy_node.strip().split('://')
 
             self.protocol = part1
 
-            # ss://YWVzLTI1Ni1nY206MTE0NTE0@173.82.232.224:56634#%E6%B5%8B%E8%AF%95
-            # ss://YWVzLTI1Ni1nY206WTZSOXBBdHZ4eHptR0NAMTcyLjk5LjE5MC4zNTozMzA2#🇺🇸US_1950
-            if self.protocol == 'ss':
-                proxy_data, proxy_name = part2.split('#')
-                if '@' in proxy_data:
-                    self.name = urllib.parse.unquote(proxy_name)
-
-                    proxy_data_res, addr_and_port = proxy_data.split('@')
-                    self.address, self.port = addr_and_port.split(':')
-                    self.encryption, self.password = base64_decode(proxy_data_res).split(':')
+            parser = _LINK_PARSERS.get(self.protocol)
+            if parser:
+                if decoded is not None and self.protocol == 'vmess':
+                    result = self._load_vmess(part2, stats, decoded)
                 else:
-                    self.name = urllib.parse.unquote(proxy_name)
-
-                    proxy_data = base64_decode(proxy_data)
-                    self.encryption, proxy_data_rest, self.port = proxy_data.split(':')
-                    self.password, self.address = proxy_data_rest.rsplit('@', 1)  # 密码中可能用@
-            elif self.protocol == 'ssr':
-                part2 = part2.replace('-', '+').replace('_', '/')
-                proxy_data = base64_decode(part2)
-
-                # 183.232.56.182:1254:auth_aes128_md5:chacha20-ietf:plain:bXRidjhu/?remarks=SmFwYW4&protoparam=MTE0ODgyOkx3ZFlMag&obfsparam=dC5tZS92cG5oYXQ
-                self.address, self.port, self.clash_ssr_protocol, self.security, self.clash_ssr_obfs, proxy_data_rest = proxy_data.split(
-                    ':')
-
-                # bXRidjhu/?remarks=SmFwYW4&protoparam=MTE0ODgyOkx3ZFlMag&obfsparam=dC5tZS92cG5oYXQ
-                password_base64, proxy_data_rest = proxy_data_rest.split('/?')
-                self.password = base64_decode(password_base64)
-
-                # remarks=SmFwYW4&protoparam=MTE0ODgyOkx3ZFlMag&obfsparam=dC5tZS92cG5oYXQ
-                for i in proxy_data_rest.split('&'):
-                    if i.startswith('remarks'):
-                        self.name = base64_decode(i.removeprefix('remarks='))
-                    elif i.startswith('protoparam'):
-                        self.clash_ssr_protocol_param = base64_decode(i.removeprefix('protoparam='))
-                    elif i.startswith('obfsparam'):
-                        self.clash_ssr_obfs_param = base64_decode(i.removeprefix('obfsparam='))
-                    else:
-                        logger.warning(f'ssr链接未解析参数：{i}')
-            elif self.protocol == 'vmess':
-                v2rayN_json = None
-                try:
-                    v2rayN_json = json.loads(base64_decode(part2))
-                except:
-                    logger.error(f'无效v2格式，base64解析v2节点出错: {v2rayN_json}')
-                    return False
-
-                if v2rayN_json['net'] == 'tcp':  # 注意
-                    v2rayN_json['type'] = 'http'
-
-                ip = v2rayN_json.get('add', '')
-                if not check_ip(ip):
-                    logger.debug(f'无效的ip: {ip}')
-                    return False
-                self.v = v2rayN_json.get('v', 2)
-                self.name = v2rayN_json['ps']
-                self.address = v2rayN_json['add']
-                self.port = v2rayN_json['port']
-                self.uuid = v2rayN_json['id']
-                self.alter_id = v2rayN_json['aid']
-                self.security = v2rayN_json.get('scy')
-                self.network = v2rayN_json['net']
-                self.type = v2rayN_json['type']
-                self.host = v2rayN_json['host']
-                self.path = v2rayN_json['path']
-                self.tls = True if v2rayN_json['tls'] else None
-                self.sni = v2rayN_json.get('sni')
-            elif self.protocol == 'trojan':
-                self.password, self.address, port_like, trojan_name = re.split(r':|@|#', part2)
-
-                self.name = urllib.parse.unquote(trojan_name)
-
-                if '?' in port_like:
-                    port, params = port_like.split('?')
-
-                    param_pair_list = params.split('&')
-                    for i in param_pair_list:
-                        if i.startswith('peer='):
-                            self.peer = i.removeprefix('peer=')
-                        elif i.startswith('sni='):
-                            self.sni = i.removeprefix('sni=')
-                        elif i.startswith('security='):
-                            self.security = i.removeprefix('security=')
-                        elif i.startswith('type='):
-                            self.network = i.removeprefix('type=')
-                        elif i.startswith('encryption='):
-                            self.encryption = i.removeprefix('encryption=')
-                        elif i.startswith('flow='):
-                            self.flow = i.removeprefix('flow=')
-                        elif i.startswith('headerType='):
-                            self.type = i.removeprefix('headerType=')
-                        elif i.startswith('host='):
-                            self.host = i.removeprefix('host=')
-                        elif i.startswith('alpn='):
-                            self.alpn = urllib.parse.unquote(i.removeprefix('alpn='))
-                        elif i.startswith('allowInsecure='):
-                            allow_insecure = i.removeprefix('allowInsecure=')
-                            if allow_insecure == '1':  # allowInsecure=1，允许不安全（跳过证书验证）, v2rayN无效
-                                self.skip_cert_verify = True
-                            else:
-                                logger.warning(f'trojan连接中?后面参数allowInsecure未识别：{i}')
-                        else:
-                            logger.warning(f'trojan连接中?后面未解析解析参数：{i}')
-                else:
-                    port = port_like
-
-                if port.isnumeric():
-                    self.port = port
-                else:
-                    # 3424/
-                    self.port = re.match(r'\d+', port).group()
-                    logger.warning(f'trojan连接中port后面出现特殊字符：{port}')
-            elif self.protocol == 'vless':
-                # vless://72972da9-d188-40c6-83a6-4ec28fde2c0a@cg.rutracker-cn.com:443?path=%2FxxPb49hL0C&security=tls&encryption=none&type=ws&sni=cg.rutracker-cn.com#v2cross.com
-                proxy_data, self.name = part2.rsplit('#', 1)
-                proxy_data_start, proxy_data_end = proxy_data.split('?')
-
-                # 72972da9-d188-40c6-83a6-4ec28fde2c0a@cg.rutracker-cn.com:443
-                self.uuid, self.address, self.port = re.split(r'@|:', proxy_data_start)
-
-                # path=%2FxxPb49hL0C&security=tls&encryption=none&type=ws&sni=cg.rutracker-cn.com
-                param_pair_list = proxy_data_end.split('&')
-                for i in param_pair_list:
-                    if i.startswith('path='):
-                        self.path = urllib.parse.unquote(i.removeprefix('path='))
-                    elif i.startswith('security='):
-                        self.tls = True if 'tls' in i else None
-                    elif i.startswith('encryption='):
-                        self.encryption = i.removeprefix('encryption=')
-                    elif i.startswith('type='):
-                        self.network = i.removeprefix('type=')
-                    elif i.startswith('sni='):
-                        self.sni = i.removeprefix('sni=')
-                    elif i.startswith('flow='):
-                        self.flow = i.removeprefix('flow=')
-                    elif i.startswith('alpn='):
-                        self.alpn = i.removeprefix('alpn=')
-                    elif i.startswith('host='):
-                        self.host = i.removeprefix('host=')
-                    elif i.startswith('headerType='):
-                        self.type = i.removeprefix('headerType=')
-                    else:
-                        logger.warning(f'vless链接未解析参数：{i}')
+                    result = parser(self, part2, stats)
+                if result:
+                    return result
 
             if self.address and not check_ip(self.address):
-                logger.warning(f'节点ip不合法：{self.address}')
-                return False
+                return INVALID_IP
         elif isinstance(proxy_node, dict):
             self.address = proxy_node.get('server', '')
             if not check_ip(self.address):
-                logger.warning(f'节点ip不合法：{self.address}')
-                return False
+                return INVALID_IP
 
             self.name = proxy_node.get('name', '')
             self.protocol = proxy_node.get('type', '')
@@ -249,7 +217,7 @@ class ProxyNode(object):
                     if paths and isinstance(paths, list) and len(paths) > 0:
                         self.path = paths[0]
                         if len(paths) > 1:
-                            logger.warning(f'节点：{proxy_node}，path多个->{paths}')
+                            logger.warning('节点：{}，path多个->{}', proxy_node, paths)
 
                     headers = http_opts.get('headers')
                     if headers:
@@ -257,7 +225,7 @@ class ProxyNode(object):
                         if Host and isinstance(Host, list):
                             self.host = Host[0]
                             if len(Host) > 1:
-                                logger.warning(f'节点：{proxy_node}，headers:Host多个->{paths}')
+                                logger.warning('节点：{}，headers:Host多个->{}', proxy_node, paths)
             elif self.protocol == 'trojan':
                 self.password = proxy_node.get('password', '')
                 self.network = proxy_node.get('network', '')
@@ -283,10 +251,148 @@ class ProxyNode(object):
 
         if self.address:
             self.name = self.name.strip()
-            return True
+            self._intern_fields()
+            return PARSED
         else:
-            logger.warning(f'无法识别节点: {proxy_node}')
-            return False
+            return UNSUPPORTED
+
+    def _load_ss(self, part2, stats=None):
+        # ss://YWVzLTI1Ni1nY206MTE0NTE0@173.82.232.224:56634#%E6%B5%8B%E8%AF%95
+        # ss://YWVzLTI1Ni1nY206WTZSOXBBdHZ4eHptR0NAMTcyLjk5LjE5MC4zNTozMzA2#🇺🇸US_1950
+        proxy_data, proxy_name = part2.split('#')
+        self.name = unquote(proxy_name)
+
+        if '@' in proxy_data:
+            proxy_data_res, addr_and_port = proxy_data.split('@')
+            self.address, self.port = addr_and_port.split(':')
+            self.encryption, self.password = base64_decode(proxy_data_res).split(':')
+        else:
+            proxy_data = base64_decode(proxy_data)
+            self.encryption, proxy_data_rest, self.port = proxy_data.split(':')
+            self.password, self.address = proxy_data_rest.rsplit('@', 1)  # 密码中可能用@
+
+    def _load_ssr(self, part2, stats=None):
+        # 外层和参数值都是urlsafe base64，base64_decode均可直接解码
+        proxy_data = base64_decode(part2)
+
+        # 183.232.56.182:1254:auth_aes128_md5:chacha20-ietf:plain:bXRidjhu/?remarks=SmFwYW4&protoparam=MTE0ODgyOkx3ZFlMag&obfsparam=dC5tZS92cG5oYXQ
+        self.address, self.port, self.clash_ssr_protocol, self.security, self.clash_ssr_obfs, proxy_data_rest = proxy_data.split(
+            ':')
+
+        # bXRidjhu/?remarks=SmFwYW4&protoparam=MTE0ODgyOkx3ZFlMag&obfsparam=dC5tZS92cG5oYXQ
+        password_base64, params = proxy_data_rest.split('/?')
+        self.password = base64_decode(password_base64)
+
+        # remarks=SmFwYW4&protoparam=MTE0ODgyOkx3ZFlMag&obfsparam=dC5tZS92cG5oYXQ
+        fields, unknown = _parse_params(params, _SSR_PARAMS)
+        for field, value in fields.items():
+            setattr(self, field, base64_decode(value))
+        for i in unknown:
+            _note(stats, UNKNOWN_PARAM, 'ssr链接未解析参数：{}', i)
+
+    def _load_vmess(self, part2, stats=None, v2rayN_json=None):
+        if v2rayN_json is None:
+            try:
+                v2rayN_json = _json_loads(base64_decode_bytes(part2))
+            except:
+                return INVALID
+
+        if v2rayN_json['net'] == 'tcp':  # 注意
+            v2rayN_json['type'] = 'http'
+
+        ip = v2rayN_json.get('add', '')
+        if not check_ip(ip):
+            return INVALID_IP
+        self.v = v2rayN_json.get('v', 2)
+        self.name = v2rayN_json['ps']
+        self.address = v2rayN_json['add']
+        self.port = v2rayN_json['port']
+        self.uuid = v2rayN_json['id']
+        self.alter_id = v2rayN_json['aid']
+        self.security = v2rayN_json.get('scy')
+        self.network = v2rayN_json['net']
+        self.type = v2rayN_json['type']
+        self.host = v2rayN_json['host']
+        self.path = v2rayN_json['path']
+        self.tls = True if v2rayN_json['tls'] else None
+        self.sni = v2rayN_json.get('sni')
+
+    def _load_trojan(self, part2, stats=None):
+        self.password, self.address, port_like, trojan_name = _TROJAN_SPLIT.split(part2)
+
+        self.name = unquote(trojan_name)
+
+        if '?' in port_like:
+            port, params = port_like.split('?')
+
+            fields, unknown = _parse_params(params, _TROJAN_PARAMS)
+            if 'alpn' in fields:
+                fields['alpn'] = unquote(fields['alpn'])
+            allow_insecure = fields.pop('skip_cert_verify', None)
+            if allow_insecure == '1':  # allowInsecure=1，允许不安全（跳过证书验证）, v2rayN无效
+                self.skip_cert_verify = True
+            elif allow_insecure is not None:
+                _note(stats, INSECURE_FLAG, 'trojan连接中?后面参数allowInsecure未识别：allowInsecure={}', allow_insecure)
+
+            for field, value in fields.items():
+                setattr(self, field, value)
+            for i in unknown:
+                _note(stats, UNKNOWN_PARAM, 'trojan连接中?后面未解析参数：{}', i)
+        else:
+            port = port_like
+
+        if port.isnumeric():
+            self.port = port
+        else:
+            # 3424/
+            self.port = _DIGITS.match(port).group()
+            _note(stats, MALFORMED_PORT, 'trojan连接中port后面出现特殊字符：{}', port)
+
+    def _load_vless(self, part2, stats=None):
+        # vless://72972da9-d188-40c6-83a6-4ec28fde2c0a@cg.rutracker-cn.com:443?path=%2FxxPb49hL0C&security=tls&encryption=none&type=ws&sni=cg.rutracker-cn.com#v2cross.com
+        proxy_data, self.name = part2.rsplit('#', 1)
+        proxy_data_start, params = proxy_data.split('?')
+
+        # 72972da9-d188-40c6-83a6-4ec28fde2c0a@cg.rutracker-cn.com:443
+        self.uuid, self.address, self.port = _VLESS_SPLIT.split(proxy_data_start)
+
+        # path=%2FxxPb49hL0C&security=tls&encryption=none&type=ws&sni=cg.rutracker-cn.com
+        fields, unknown = _parse_params(params, _VLESS_PARAMS)
+        if 'path' in fields:
+            fields['path'] = unquote(fields['path'])
+        if 'tls' in fields:
+            fields['tls'] = True if 'tls' in fields['tls'] else None
+
+        for field, value in fields.items():
+            setattr(self, field, value)
+        for i in unknown:
+            _note(stats, UNKNOWN_PARAM, 'vless链接未解析参数：{}', i)
+
+    def _intern_fields(self):
+        # 同一订阅中协议、端口、uuid、host、path等字段大量重复，驻留后所有节点共享同一个字符串对象
+        for field in _INTERNED_FIELDS:
+            value = getattr(self, field)
+            if type(value) is str:
+                setattr(self, field, sys.intern(value))
+
+    def copy(self) -> 'ProxyNode':
+        node = ProxyNode.__new__(ProxyNode)
+        for field in self.__slots__:
+            setattr(node, field, getattr(self, field))
+        return node
+
+    def to_fields(self) -> dict:
+        # 用于持久化，只保留有值的字段
+        return {i: getattr(self, i) for i in self.__slots__ if getattr(self, i) is not None}
+
+    @classmethod
+    def from_fields(cls, fields: dict) -> 'ProxyNode':
+        node = cls()
+        for field, value in fields.items():
+            if field in _FIELDS:
+                setattr(node, field, value)
+        node._intern_fields()
+        return node
 
     def generate_v2rayn_link(self):
         if self.protocol == 'vmess':
@@ -361,7 +467,7 @@ class ProxyNode(object):
                 proxy = f'{proxy}?{"&".join(params)}'
             return self.protocol + '://' + proxy + f'#{self.name}'
         else:
-            logger.warning(f'v2rayN暂不支持该协议：{self.protocol}')
+            logger.debug('v2rayN暂不支持该协议：{}', self.protocol)
             return False
 
     def generate_surfboard_proxy(self):
@@ -404,7 +510,7 @@ class ProxyNode(object):
 
             surfboard_proxy = f'{surfboard_proxy}, username={self.uuid}{udp_relay}{ws}{tls}{ws_path}{ws_headers}{skip_cert_verify}{sni}{vmess_aead}'
         else:
-            logger.warning(f'surfboard暂不支持该协议：{self.protocol}')
+            logger.debug('surfboard暂不支持该协议：{}', self.protocol)
             return False
 
         return self.name, surfboard_proxy
@@ -480,7 +586,7 @@ class ProxyNode(object):
                 'udp': self.udp
             }
         else:
-            logger.warning(f'clash暂不支持该协议：{self.protocol}')
+            logger.debug('clash暂不支持该协议：{}', self.protocol)
             return False
 
         if extra_data:
@@ -506,13 +612,42 @@ class ProxyNode(object):
             # tls-cert???
             leaf_proxy = f'{leaf_proxy}, username={self.uuid}{ws}{ws_path}{tls}'
         else:
-            logger.warning(f'leaf暂不支持该协议：{self.protocol}')
+            logger.debug('leaf暂不支持该协议：{}', self.protocol)
             return False
 
         return self.name, leaf_proxy
 
     def __str__(self):
-        return os.linesep.join([f'{i[0]}={i[1]}' for i in vars(self).items() if i[1]])
+        items = [(i, getattr(self, i)) for i in self.__slots__]
+        return os.linesep.join([f'{i[0]}={i[1]}' for i in items if i[1]])
+
+
+_FIELDS = frozenset(ProxyNode.__slots__)
+
+
+def decode_vmess_payloads(payloads: List[str]) -> List[Optional[dict]]:
+    """
+    批量解码一个订阅中所有vmess链接://之后的内容(base64编码的json)，无法解码或不是json对象的为None
+    每个链接单独解析，格式错误的内容不会影响其他链接
+    """
+    results = []
+    for payload in payloads:
+        try:
+            value = _json_loads(base64_decode_bytes(payload))
+        except ValueError:
+            value = None
+        results.append(value if isinstance(value, dict) else None)
+    return results
+
+
+# 协议 -> 分享链接解析方法
+_LINK_PARSERS = {
+    'ss': ProxyNode._load_ss,
+    'ssr': ProxyNode._load_ssr,
+    'vmess': ProxyNode._load_vmess,
+    'trojan': ProxyNode._load_trojan,
+    'vless': ProxyNode._load_vless,
+}
 
 
 if __name__ == '__main__':
@@ -1,38 +1,49 @@
+import functools
 import os
 import re
-from typing import Union, List
+from typing import Union, List, Iterable, Iterator, Tuple
 
-import yaml
 from loguru import logger
 
-from core.config_model import ProxyNode
-from core.helper import base64_encode, base64_decode, check_and_rename
+from core.config_model import ProxyNode, decode_vmess_payloads
+from core.helper import base64_encode_stream, base64_decode, NameAllocator, yaml_load, yaml_dump
+from core.stats import INVALID
 
 
-def _v2sub_2_nodelist(sub_content):
+def _v2sub_2_nodelist(sub_content, stats=None):
     try:
         origin_sub = base64_decode(sub_content)
     except:
         logger.error(f'v2订阅转码失败，查明！{sub_content}')
         return []
 
-    logger.debug(f"base64解码后订阅：{origin_sub}")
-    raw_links = re.split('\r\n|\n|\r', origin_sub)
+    logger.debug("base64解码后订阅：{}", origin_sub)
+    links = [i.strip() for i in re.split('\r\n|\n|\r', origin_sub)]
+
+    # 所有vmess链接一次批量解码
+    vmess_indexes = [i for i, link in enumerate(links) if link.startswith('vmess://')]
+    vmess_data = decode_vmess_payloads([links[i][8:] for i in vmess_indexes])
+    decoded = dict(zip(vmess_indexes, vmess_data))
 
     nodes = []
-    for link in raw_links:
-        link = link.strip()
+    for i, link in enumerate(links):
+        if i in decoded and decoded[i] is None:
+            # 批量解码失败的vmess链接直接记为格式错误，不再逐个解码一次
+            if stats is not None:
+                stats.add(INVALID)
+            logger.debug('节点未加载({}): {}', INVALID, link)
+            continue
         pn = ProxyNode()
-        if pn.load(link):
+        if pn.load(link, stats, decoded.get(i)):
             nodes.append(pn)
 
     return nodes
 
 
-def _clashsub_2_nodelist(sub_content):
+def _clashsub_2_nodelist(sub_content, stats=None, resolver=None, depth=0, visited=frozenset()):
     dict_clash_content = {}
     try:
-        dict_clash_content = yaml.load(sub_content, Loader=yaml.FullLoader)  # yaml中有类似@字符导致无法解析
+        dict_clash_content = yaml_load(sub_content)  # yaml中有类似@字符导致无法解析
     except Exception as e:
         logger.error(f'yaml解析失败: {e}')
     proxies = dict_clash_content.get("proxies", None)
@@ -40,45 +51,93 @@ def _clashsub_2_nodelist(sub_content):
 
     nodes = []
     if proxies:
-        logger.debug(f'直接获取clash中的proxies：{proxies}')
+        logger.debug('直接获取clash中的proxies：{}', proxies)
         for proxy in proxies:
             pn = ProxyNode()
-            if pn.load(proxy):
+            if pn.load(proxy, stats):
                 nodes.append(pn)
 
     elif proxy_providers:
         logger.info(f'获取clash中的proxy-providers')
-        for k, v in proxy_providers.items():
-            provider_url = v["url"]
-            provider_nodes = sub_2_nodelist(provider_url)
-            logger.info(f"proxy-providers[{k}]节点个数: {len(provider_nodes)}")
-            nodes.extend(provider_nodes)
+        nodes = _providers_2_nodelist(proxy_providers, stats, resolver, depth, visited)
+    return nodes
+
+
+def _providers_2_nodelist(proxy_providers, stats, resolver, depth, visited):
+    """
+    并发获取所有provider的内容后再逐个解析，provider中又引用provider时递归处理
+    depth超过resolver.max_depth或url已在本条引用链上出现过时跳过，避免循环引用
+    """
+    if resolver is None:
+        logger.warning('未配置proxy-providers的获取方式，跳过')
+        return []
+    if depth >= resolver.max_depth:
+        logger.warning(f'proxy-providers嵌套超过{resolver.max_depth}层，跳过')
+        return []
+
+    providers = []
+    for k, v in proxy_providers.items():
+        provider_url = v.get("url") if isinstance(v, dict) else None
+        if not provider_url or not provider_url.startswith("http"):
+            logger.warning(f"proxy-providers[{k}]没有可获取的url，跳过")
+            continue
+        if provider_url in visited:
+            logger.warning(f"proxy-providers[{k}]循环引用，跳过: {provider_url}")
+            continue
+        interval = v.get("interval")
+        providers.append((k, provider_url, interval if isinstance(interval, int) and interval > 0 else None))
+
+    # 同一url只获取一次
+    intervals = {}
+    for _, provider_url, interval in providers:
+        intervals.setdefault(provider_url, interval)
+    contents = dict(zip(intervals, resolver.fetch(list(intervals.items()))))
+
+    nodes = []
+    for k, provider_url, _ in providers:
+        content = contents.get(provider_url)
+        if not content:
+            continue
+        provider_nodes = sub_2_nodelist(content, stats, resolver, depth + 1, visited | {provider_url})
+        logger.info(f"proxy-providers[{k}]节点个数: {len(provider_nodes)}")
+        nodes.extend(provider_nodes)
     return nodes
 
 
-def sub_2_nodelist(sub_content):
+def sub_2_nodelist(sub_content, stats=None, resolver=None, depth=0, visited=frozenset()):
+    """
+    resolver: 获取clash proxy-providers内容的ProviderResolver，为None时不获取
+    visited: 当前引用链上已获取过的订阅url
+    """
     # sub_content = remove_special_characters(sub_content)
 
     if "rules:" in sub_content or sub_content.startswith("proxies:"):
         logger.info("该订阅为clash订阅")
-        nodes = _clashsub_2_nodelist(sub_content)
+        nodes = _clashsub_2_nodelist(sub_content, stats, resolver, depth, visited)
         # logger.info(f"clash订阅中节点个数：{len(nodes)}")
     else:
         logger.info("该订阅为v2订阅")
-        nodes = _v2sub_2_nodelist(sub_content)
+        nodes = _v2sub_2_nodelist(sub_content, stats)
         # logger.info(f"v2订阅中节点个数：{len(nodes)}")
     return nodes
 
 
-def change_host(nodes: Union[ProxyNode, List[ProxyNode]], host: str):
+def change_host(nodes: Union[ProxyNode, List[ProxyNode]], host: str) -> List[ProxyNode]:
+    """
+    返回替换host后的节点副本，解析结果会被缓存并在多个请求间共享，不能直接修改
+    """
     if isinstance(nodes, ProxyNode):
         nodes = [nodes]
 
+    changed = []
     for node in nodes:
+        node = node.copy()
         node.host = host
+        changed.append(node)
+    return changed
 
 
-def generate_sub(nodes: Union[ProxyNode, List[ProxyNode]], client: str, ml: bool = False) -> str:
+def _filter_and_sort(nodes: Union[ProxyNode, List[ProxyNode]], ml: bool) -> List[ProxyNode]:
     if isinstance(nodes, ProxyNode):
         nodes = [nodes]
 
@@ -90,267 +149,317 @@ def generate_sub(nodes: Union[ProxyNode, List[ProxyNode]], client: str, ml: bool
         nodes = tmp
         logger.info(f'可用免流节点个数：{len(nodes)}')
 
-    nodes.sort(key=lambda x: x.protocol)
+    # 返回排好序的新列表：同一份节点会被多个请求在不同线程中同时生成订阅，不能原地排序
+    return sorted(nodes, key=lambda x: x.protocol)
 
-    sub = ""
-    if client == "v2rayN":
-        v2_links = []
-        for node in nodes:
-            proxy = node.generate_v2rayn_link()
-            logger.debug(f'生成v2节点: {proxy}')
-            if proxy:
-                v2_links.append(proxy)
-        sub = base64_encode(os.linesep.join(v2_links))
-    elif client == "Clash":
-        sub = {
-            "port": 1087,
-            "socks-port": 1086,
-            # "mixed-port": 7890,
-            "allow-lan": False,
-            "mode": "Rule",
-            "log-level": "silent",
-            "external-controller": "127.0.0.1:9090",
-            "dns": {
-                "enable": True,
-                "enhanced-mode": "fake-ip",
-                "fake-ip-range": "198.18.0.1/16",
-                "ipv6": False,
-                "nameserver": [
-                    "114.114.114.114",
-                    "223.5.5.5",
-                    "tls://13800000000.rubyfish.cn:853"
-                ],
-                "fallback": [
-                    "https://cloudflare-dns.com/dns-query",
-                    "https://dns.google/dns-query",
-                    "https://1.1.1.1/dns-query",
-                    "tls://8.8.8.8:853"
-                ],
-                "fallback-filter": {
-                    "geoip": True,
-                    "geoip-code": "CN",
-                    "ipcidr": [
-                        "240.0.0.0/4"
-                    ]
-                }
-            },
-            'proxies': [],
-            "proxy-groups": [
-                {"name": "🌐 Select",
-                 "type": "select",
-                 "proxies": ['♻ Auto']},
-                {"name": "♻ Auto",
-                 "type": "url-test",
-                 "proxies": [],
-                 "url": "http://www.gstatic.com/generate_204",
-                 "interval": 600,
-                 "lazy": True}
+
+def _join_lines(lines: Iterable[str]) -> Iterator[str]:
+    # 与os.linesep.join(lines)输出一致，但逐行产出
+    for i, line in enumerate(lines):
+        yield line if i == 0 else os.linesep + line
+
+
+def _v2rayn_lines(nodes: List[ProxyNode]) -> Iterator[str]:
+    for node in nodes:
+        proxy = node.generate_v2rayn_link()
+        logger.debug('生成v2节点: {}', proxy)
+        if proxy:
+            yield proxy
+
+
+def _clash_config(ml: bool) -> dict:
+    """
+    clash配置中与节点无关的固定部分
+    """
+    config = {
+        "port": 1087,
+        "socks-port": 1086,
+        # "mixed-port": 7890,
+        "allow-lan": False,
+        "mode": "Rule",
+        "log-level": "silent",
+        "external-controller": "127.0.0.1:9090",
+        "dns": {
+            "enable": True,
+            "enhanced-mode": "fake-ip",
+            "fake-ip-range": "198.18.0.1/16",
+            "ipv6": False,
+            "nameserver": [
+                "114.114.114.114",
+                "223.5.5.5",
+                "tls://13800000000.rubyfish.cn:853"
+            ],
+            "fallback": [
+                "https://cloudflare-dns.com/dns-query",
+                "https://dns.google/dns-query",
+                "https://1.1.1.1/dns-query",
+                "tls://8.8.8.8:853"
             ],
-            "rule-providers": {
-                "anti-AD": {
-                    "type": "http",
-                    "behavior": "domain",
-                    "url": "https://anti-ad.net/clash.yaml",
-                    "path": "./ruleset/anti-AD.yaml",
-                    "interval": 86400
-                },
-                "reject": {
-                    "type": "http",
-                    "behavior": "domain",
-                    "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/reject.txt",
-                    "path": "./ruleset/reject.yaml",
-                    "interval": 86400
-                },
-                "icloud": {
-                    "type": "http",
-                    "behavior": "domain",
-                    "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/icloud.txt",
-                    "path": "./ruleset/icloud.yaml",
-                    "interval": 86400
-                },
-                "apple": {
-                    "type": "http",
-                    "behavior": "domain",
-                    "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/apple.txt",
-                    "path": "./ruleset/apple.yaml",
-                    "interval": 86400
-                },
-                "google": {
-                    "type": "http",
-                    "behavior": "domain",
-                    "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/google.txt",
-                    "path": "./ruleset/google.yaml",
-                    "interval": 86400
-                },
-                "proxy": {
-                    "type": "http",
-                    "behavior": "domain",
-                    "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/proxy.txt",
-                    "path": "./ruleset/proxy.yaml",
-                    "interval": 86400
-                },
-                "direct": {
-                    "type": "http",
-                    "behavior": "domain",
-                    "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/direct.txt",
-                    "path": "./ruleset/direct.yaml",
-                    "interval": 86400
-                },
-                "private": {
-                    "type": "http",
-                    "behavior": "domain",
-                    "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/private.txt",
-                    "path": "./ruleset/private.yaml",
-                    "interval": 86400
-                },
-                "tld-not-cn": {
-                    "type": "http",
-                    "behavior": "domain",
-                    "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/tld-not-cn.txt",
-                    "path": "./ruleset/tld-not-cn.yaml",
-                    "interval": 86400
-                },
-                "telegramcidr": {
-                    "type": "http",
-                    "behavior": "ipcidr",
-                    "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/telegramcidr.txt",
-                    "path": "./ruleset/telegramcidr.yaml",
-                    "interval": 86400
-                },
-                "lancidr": {
-                    "type": "http",
-                    "behavior": "ipcidr",
-                    "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/lancidr.txt",
-                    "path": "./ruleset/lancidr.yaml",
-                    "interval": 86400
-                }
+            "fallback-filter": {
+                "geoip": True,
+                "geoip-code": "CN",
+                "ipcidr": [
+                    "240.0.0.0/4"
+                ]
+            }
+        },
+        "rule-providers": {
+            "anti-AD": {
+                "type": "http",
+                "behavior": "domain",
+                "url": "https://anti-ad.net/clash.yaml",
+                "path": "./ruleset/anti-AD.yaml",
+                "interval": 86400
             },
-            "rules": [
-                "PROCESS-NAME,CloudflareST.exe,DIRECT",
-                "PROCESS-NAME,CloudflareST,DIRECT",
-                "RULE-SET,anti-AD,REJECT",
-                "RULE-SET,private,DIRECT",
-                "RULE-SET,reject,REJECT",
-                "RULE-SET,icloud,DIRECT",
-                "RULE-SET,apple,DIRECT",
-                "RULE-SET,google,DIRECT",
-                "RULE-SET,proxy,🌐 Select",
-                "RULE-SET,tld-not-cn,🌐 Select",
-                "RULE-SET,direct,DIRECT",
-                "RULE-SET,telegramcidr,🌐 Select,no-resolve",
-                "RULE-SET,lancidr,DIRECT,no-resolve",
-                "GEOIP,CN,DIRECT",
-                "MATCH,🌐 Select"
-            ]
-        }
-
-        if ml:
-            sub.pop('rule-providers')
-            sub.update({
-                'rules': ["MATCH,🌐 Select"]
-            })
-
-        proxies = sub['proxies']
-        proxy_names = sub["proxy-groups"][0]["proxies"]
-        auto_names = sub["proxy-groups"][1]["proxies"]
-
-        proxy_nodes = []
-        for node in nodes:
-            proxy = node.generate_clash_proxy()
-            logger.debug(f'生成clash节点: {proxy}')
-
-            if proxy:
-                name = check_and_rename(proxy_nodes, proxy["name"])
-                proxy['name'] = name
-
-                proxies.append(proxy)
-                proxy_names.append(name)
-                auto_names.append(name)
-
-        sub = yaml.dump(sub)
-    elif client == "Surfboard":
-        sub_data = [
-            '[General]',
-            'dns-server = 8.8.8.8, 114.114.114.114',
-            'skip-proxy = 127.0.0.1, 192.168.0.0/16, 10.0.0.0/8, 172.16.0.0/12, 100.64.0.0/10, localhost, *.local',
-            'proxy-test-url = http://www.gstatic.com/generate_204',
-            'http-listen = 0.0.0.0:1087',
-            'socks5-listen = 0.0.0.0:1086',
-            '[Proxy]'
+            "reject": {
+                "type": "http",
+                "behavior": "domain",
+                "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/reject.txt",
+                "path": "./ruleset/reject.yaml",
+                "interval": 86400
+            },
+            "icloud": {
+                "type": "http",
+                "behavior": "domain",
+                "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/icloud.txt",
+                "path": "./ruleset/icloud.yaml",
+                "interval": 86400
+            },
+            "apple": {
+                "type": "http",
+                "behavior": "domain",
+                "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/apple.txt",
+                "path": "./ruleset/apple.yaml",
+                "interval": 86400
+            },
+            "google": {
+                "type": "http",
+                "behavior": "domain",
+                "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/google.txt",
+                "path": "./ruleset/google.yaml",
+                "interval": 86400
+            },
+            "proxy": {
+                "type": "http",
+                "behavior": "domain",
+                "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/proxy.txt",
+                "path": "./ruleset/proxy.yaml",
+                "interval": 86400
+            },
+            "direct": {
+                "type": "http",
+                "behavior": "domain",
+                "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/direct.txt",
+                "path": "./ruleset/direct.yaml",
+                "interval": 86400
+            },
+            "private": {
+                "type": "http",
+                "behavior": "domain",
+                "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/private.txt",
+                "path": "./ruleset/private.yaml",
+                "interval": 86400
+            },
+            "tld-not-cn": {
+                "type": "http",
+                "behavior": "domain",
+                "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/tld-not-cn.txt",
+                "path": "./ruleset/tld-not-cn.yaml",
+                "interval": 86400
+            },
+            "telegramcidr": {
+                "type": "http",
+                "behavior": "ipcidr",
+                "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/telegramcidr.txt",
+                "path": "./ruleset/telegramcidr.yaml",
+                "interval": 86400
+            },
+            "lancidr": {
+                "type": "http",
+                "behavior": "ipcidr",
+                "url": "https://cdn.jsdelivr.net/gh/Loyalsoldier/clash-rules@release/lancidr.txt",
+                "path": "./ruleset/lancidr.yaml",
+                "interval": 86400
+            }
+        },
+        "rules": [
+            "PROCESS-NAME,CloudflareST.exe,DIRECT",
+            "PROCESS-NAME,CloudflareST,DIRECT",
+            "RULE-SET,anti-AD,REJECT",
+            "RULE-SET,private,DIRECT",
+            "RULE-SET,reject,REJECT",
+            "RULE-SET,icloud,DIRECT",
+            "RULE-SET,apple,DIRECT",
+            "RULE-SET,google,DIRECT",
+            "RULE-SET,proxy,🌐 Select",
+            "RULE-SET,tld-not-cn,🌐 Select",
+            "RULE-SET,direct,DIRECT",
+            "RULE-SET,telegramcidr,🌐 Select,no-resolve",
+            "RULE-SET,lancidr,DIRECT,no-resolve",
+            "GEOIP,CN,DIRECT",
+            "MATCH,🌐 Select"
         ]
+    }
 
-        proxy_nodes = []
-        proxy_name_list = []
-        for node in nodes:
-            proxy_node = node.generate_surfboard_proxy()
-            if proxy_node:
-                proxy_name, proxy_info = proxy_node
-                logger.debug(f'生成Surfboard节点: {proxy_name} = {proxy_info}')
-
-                name = check_and_rename(proxy_nodes, proxy_name)
-                sub_data.append(f'{name} = {proxy_info}')
-                proxy_name_list.append(name)
-
-        names = ', '.join(proxy_name_list)
-
-        sub_data.append('[Proxy Group]')
-        select_group = f'Proxy = select, Auto, {names}'
-        sub_data.append(select_group)
-        auto_group = f'Auto = url-test, {names}, url=http://www.gstatic.com/generate_204, interval=600, tolerance=100, timeout=5'
-        sub_data.append(auto_group)
-
-        sub_data.append('[Rule]')
-        if not ml:
-            sub_data.append('RULE-SET, https://cdn.jsdelivr.net/gh/Loyalsoldier/surge-rules@release/ruleset/proxy.txt, Proxy')
-            sub_data.append('RULE-SET, https://cdn.jsdelivr.net/gh/Loyalsoldier/surge-rules@release/ruleset/direct.txt, DIRECT')
-            sub_data.append('RULE-SET, https://cdn.jsdelivr.net/gh/Loyalsoldier/surge-rules@release/ruleset/telegramcidr.txt, Proxy')
-            sub_data.append('GEOIP, CN, DIRECT')
-        sub_data.append('FINAL, Proxy')
-
-        sub = os.linesep.join(sub_data)
-    elif client == "Leaf":
-        sub_data = [
-            '[General]',
-            'loglevel = info',
-            'dns-server = 8.8.8.8, 114.114.114.114',
-            'interface = 127.0.0.1',
-            'port = 1087',
-            'socks-interface = 127.0.0.1',
-            'socks-port = 1086',
-            '[Proxy]',
-            'Direct = direct',
-            'Reject = reject',
+    if ml:
+        config.pop('rule-providers')
+        config.update({
+            'rules': ["MATCH,🌐 Select"]
+        })
+    return config
+
+
+@functools.lru_cache(maxsize=None)
+def _clash_skeleton(ml: bool) -> Tuple[str, str]:
+    """
+    预先序列化固定部分，只需序列化一次
+    yaml.dump按key排序输出，proxies、proxy-groups之前的部分为head，之后的部分为tail
+    每次生成订阅时只序列化proxies和proxy-groups，再拼接到head和tail之间
+    """
+    config = _clash_config(ml)
+    head = {k: v for k, v in config.items() if k < 'proxies'}
+    tail = {k: v for k, v in config.items() if k > 'proxy-groups'}
+    return yaml_dump(head), yaml_dump(tail)
+
+
+def _clash_sub(nodes: List[ProxyNode], ml: bool) -> str:
+    proxies = []
+    proxy_names = ['♻ Auto']
+    auto_names = []
+
+    allocator = NameAllocator()
+    for node in nodes:
+        proxy = node.generate_clash_proxy()
+        logger.debug('生成clash节点: {}', proxy)
+
+        if proxy:
+            name = allocator.allocate(proxy["name"])
+            proxy['name'] = name
+
+            proxies.append(proxy)
+            proxy_names.append(name)
+            auto_names.append(name)
+
+    proxy_data = {
+        'proxies': proxies,
+        "proxy-groups": [
+            {"name": "🌐 Select",
+             "type": "select",
+             "proxies": proxy_names},
+            {"name": "♻ Auto",
+             "type": "url-test",
+             "proxies": auto_names,
+             "url": "http://www.gstatic.com/generate_204",
+             "interval": 600,
+             "lazy": True}
         ]
+    }
+
+    head, tail = _clash_skeleton(ml)
+    return head + yaml_dump(proxy_data) + tail
 
-        proxy_nodes = []
-        proxy_name_list = []
-        for node in nodes:
-            proxy_node = node.generate_leaf_proxy()
-            if proxy_node:
-                proxy_name, proxy_info = proxy_node
-                logger.debug(f'生成Leaf节点: {proxy_name} = {proxy_info}')
 
-                name = check_and_rename(proxy_nodes, proxy_name)
-                sub_data.append(f'{name} = {proxy_info}')
-                proxy_name_list.append(name)
+def _surfboard_lines(nodes: List[ProxyNode], ml: bool) -> Iterator[str]:
+    yield from [
+        '[General]',
+        'dns-server = 8.8.8.8, 114.114.114.114',
+        'skip-proxy = 127.0.0.1, 192.168.0.0/16, 10.0.0.0/8, 172.16.0.0/12, 100.64.0.0/10, localhost, *.local',
+        'proxy-test-url = http://www.gstatic.com/generate_204',
+        'http-listen = 0.0.0.0:1087',
+        'socks5-listen = 0.0.0.0:1086',
+        '[Proxy]'
+    ]
+
+    allocator = NameAllocator()
+    proxy_name_list = []
+    for node in nodes:
+        proxy_node = node.generate_surfboard_proxy()
+        if proxy_node:
+            proxy_name, proxy_info = proxy_node
+            logger.debug('生成Surfboard节点: {} = {}', proxy_name, proxy_info)
+
+            name = allocator.allocate(proxy_name)
+            yield f'{name} = {proxy_info}'
+            proxy_name_list.append(name)
+
+    names = ', '.join(proxy_name_list)
+
+    yield '[Proxy Group]'
+    yield f'Proxy = select, Auto, {names}'
+    yield f'Auto = url-test, {names}, url=http://www.gstatic.com/generate_204, interval=600, tolerance=100, timeout=5'
+
+    yield '[Rule]'
+    if not ml:
+        yield 'RULE-SET, https://cdn.jsdelivr.net/gh/Loyalsoldier/surge-rules@release/ruleset/proxy.txt, Proxy'
+        yield 'RULE-SET, https://cdn.jsdelivr.net/gh/Loyalsoldier/surge-rules@release/ruleset/direct.txt, DIRECT'
+        yield 'RULE-SET, https://cdn.jsdelivr.net/gh/Loyalsoldier/surge-rules@release/ruleset/telegramcidr.txt, Proxy'
+        yield 'GEOIP, CN, DIRECT'
+    yield 'FINAL, Proxy'
+
+
+def _leaf_lines(nodes: List[ProxyNode], ml: bool) -> Iterator[str]:
+    yield from [
+        '[General]',
+        'loglevel = info',
+        'dns-server = 8.8.8.8, 114.114.114.114',
+        'interface = 127.0.0.1',
+        'port = 1087',
+        'socks-interface = 127.0.0.1',
+        'socks-port = 1086',
+        '[Proxy]',
+        'Direct = direct',
+        'Reject = reject',
+    ]
+
+    allocator = NameAllocator()
+    proxy_name_list = []
+    for node in nodes:
+        proxy_node = node.generate_leaf_proxy()
+        if proxy_node:
+            proxy_name, proxy_info = proxy_node
+            logger.debug('生成Leaf节点: {} = {}', proxy_name, proxy_info)
 
-        names = ', '.join(proxy_name_list)
+            name = allocator.allocate(proxy_name)
+            yield f'{name} = {proxy_info}'
+            proxy_name_list.append(name)
 
-        sub_data.append('[Proxy Group]')
-        auto_group = f'Proxy = fallback, {names}, interval=600, timeout=5'
-        sub_data.append(auto_group)
+    names = ', '.join(proxy_name_list)
 
-        sub_data.append('[Rule]')
-        if not ml:
-            sub_data.append('EXTERNAL, site:category-ads-all, Reject')
-            sub_data.append('EXTERNAL, site:geolocation-!cn, Proxy')
-            sub_data.append('EXTERNAL, site:cn, Direct')
-            sub_data.append('GEOIP, CN, Direct')
-        sub_data.append('FINAL, Proxy')
+    yield '[Proxy Group]'
+    yield f'Proxy = fallback, {names}, interval=600, timeout=5'
 
-        sub = os.linesep.join(sub_data)
+    yield '[Rule]'
+    if not ml:
+        yield 'EXTERNAL, site:category-ads-all, Reject'
+        yield 'EXTERNAL, site:geolocation-!cn, Proxy'
+        yield 'EXTERNAL, site:cn, Direct'
+        yield 'GEOIP, CN, Direct'
+    yield 'FINAL, Proxy'
 
-    return sub
+
+# 支持流式生成的客户端
+STREAM_CLIENTS = ("v2rayN", "Surfboard", "Leaf")
+
+
+def generate_sub_stream(nodes: Union[ProxyNode, List[ProxyNode]], client: str, ml: bool = False) -> Iterator[str]:
+    """
+    逐段、逐节点生成订阅，拼接后与generate_sub的结果完全一致
+    Clash需要整体yaml.dump，只能一次性产出
+    """
+    nodes = _filter_and_sort(nodes, ml)
+
+    if client == "v2rayN":
+        yield from base64_encode_stream(_join_lines(_v2rayn_lines(nodes)))
+    elif client == "Clash":
+        yield _clash_sub(nodes, ml)
+    elif client == "Surfboard":
+        yield from _join_lines(_surfboard_lines(nodes, ml))
+    elif client == "Leaf":
+        yield from _join_lines(_leaf_lines(nodes, ml))
+
+
+def generate_sub(nodes: Union[ProxyNode, List[ProxyNode]], client: str, ml: bool = False) -> str:
+    return ''.join(generate_sub_stream(nodes, client, ml))
 
 
 if __name__ == '__main__':
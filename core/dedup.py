@@ -0,0 +1,77 @@
+from typing import Iterable, List, Tuple
+
+from core.config_model import ProxyNode
+
+# 重复节点的保留策略
+KEEP_FIRST = 'first'  # 保留最先出现的
+KEEP_MOST_FIELDS = 'most'  # 保留字段最多的
+POLICIES = (KEEP_FIRST, KEEP_MOST_FIELDS)
+
+# 决定节点是否为同一服务器的字段：协议、地址、端口、凭据和传输方式，不含名称和客户端侧的选项
+_KEY_FIELDS = (
+    'protocol', 'port', 'uuid', 'password', 'alter_id', 'encryption', 'security', 'network', 'type', 'host', 'path',
+    'tls', 'sni', 'flow', 'clash_ssr_obfs', 'clash_ssr_protocol', 'clash_ssr_obfs_param', 'clash_ssr_protocol_param'
+)
+
+
+# 未指定network时默认为tcp的协议
+_TCP_DEFAULT_PROTOCOLS = frozenset(('vmess', 'vless', 'trojan'))
+
+
+def node_key(node: ProxyNode) -> Tuple:
+    # 同一字段在不同来源中可能是int或str(如port)，统一转为str，空值(含False)统一为None；域名不区分大小写
+    address = node.address.lower() if isinstance(node.address, str) else node.address
+    values = {i: getattr(node, i) for i in _KEY_FIELDS}
+    for k, v in values.items():
+        values[k] = None if v is None or v == '' or v is False else str(v)
+
+    # 同一服务器在分享链接和clash配置中的写法不同，按协议默认值统一：
+    # 未指定network即tcp；vmess未指定加密方式即auto、alterId即0；
+    # 伪装类型none，以及tcp没有host的http(v2rayN链接中tcp统一记为http)，均等同于不伪装
+    if values['network'] is None and node.protocol in _TCP_DEFAULT_PROTOCOLS:
+        values['network'] = 'tcp'
+    if node.protocol == 'vmess':
+        values['security'] = values['security'] or 'auto'
+        values['alter_id'] = values['alter_id'] or '0'
+    if values['type'] == 'none' or values['type'] == 'http' and values['network'] == 'tcp' and not values['host']:
+        values['type'] = None
+
+    return (address, *values.values())
+
+
+def _field_count(node: ProxyNode) -> int:
+    return sum(1 for i in ProxyNode.__slots__ if getattr(node, i) not in (None, ''))
+
+
+class NodeIndex(object):
+    """
+    合并多个来源的节点时去重，按node_key建立索引
+    重复的节点按policy决定保留哪一个，保留的节点位于首次出现的位置
+    提供与list相同的append、extend，可直接代替list收集节点
+    """
+    __slots__ = ('policy', 'nodes', 'dropped', '_index')
+
+    def __init__(self, policy: str = KEEP_FIRST):
+        if policy not in POLICIES:
+            raise ValueError(f'不支持的去重策略: {policy}')
+        self.policy = policy
+        self.nodes: List[ProxyNode] = []
+        self.dropped = 0
+        self._index = {}  # node_key -> 在nodes中的位置
+
+    def append(self, node: ProxyNode) -> bool:
+        key = node_key(node)
+        i = self._index.get(key)
+        if i is None:
+            self._index[key] = len(self.nodes)
+            self.nodes.append(node)
+            return True
+
+        self.dropped += 1
+        if self.policy == KEEP_MOST_FIELDS and _field_count(node) > _field_count(self.nodes[i]):
+            self.nodes[i] = node
+        return False
+
+    def extend(self, nodes: Iterable[ProxyNode]):
+        for node in nodes:
+            self.append(node)
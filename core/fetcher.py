@@ -0,0 +1,101 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from core import metrics
+from core.cache import FetchCache
+
+_executor = None
+
+
+def get_executor(max_workers: int) -> ThreadPoolExecutor:
+    # 每个worker进程共享一个有界线程池，避免每个请求都新建线程
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch')
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _collect_results(urls, futures, done, deadline) -> List[Optional[Any]]:
+    results = []
+    for url, future in zip(urls, futures):
+        if future not in done:
+            future.cancel()
+            logger.error(f"获取订阅超时({deadline}s): {url}")
+            metrics.FETCH_ERRORS.labels(metrics.host_label(url), 'deadline').inc()
+            results.append(None)
+            continue
+
+        try:
+            results.append(future.result())
+        except Exception as e:
+            logger.error(f"获取订阅内容出错: {url} {e}")
+            results.append(None)
+    return results
+
+
+def fetch_all(urls: List[str], fetch: Callable[[str], Any], deadline: float, max_workers: int) -> List[Optional[Any]]:
+    """
+    并发获取所有订阅，所有订阅共用一个总超时时间deadline(秒)
+    返回结果与urls顺序一致，获取失败或超时的订阅对应None
+    """
+    if not urls:
+        return []
+
+    executor = get_executor(max_workers)
+    futures = [executor.submit(fetch, url) for url in urls]
+    done, _ = wait(futures, timeout=deadline)
+    return _collect_results(urls, futures, done, deadline)
+
+
+async def fetch_all_async(urls: List[str], fetch: Callable[[str], Any], deadline: float,
+                          max_workers: int) -> List[Optional[Any]]:
+    """
+    fetch_all的协程版本，阻塞的请求在获取订阅的线程池中执行，不占用事件循环
+    """
+    if not urls:
+        return []
+
+    loop = asyncio.get_running_loop()
+    executor = get_executor(max_workers)
+    futures = [loop.run_in_executor(executor, fetch, url) for url in urls]
+    done, _ = await asyncio.wait(futures, timeout=deadline)
+    return _collect_results(urls, futures, done, deadline)
+
+
+class ProviderResolver(object):
+    """
+    获取clash订阅中proxy-providers的内容，每次转换使用一个
+    多个provider并发获取，按各自声明的interval缓存，并记录用到的provider及其内容指纹
+    """
+
+    def __init__(self, cache: FetchCache, deadline: float, max_workers: int, max_depth: int):
+        self.max_depth = max_depth
+        self._cache = cache
+        self._deadline = deadline
+        self._max_workers = max_workers
+
+        # url -> (interval, 内容指纹)
+        self.fingerprints: Dict[str, Tuple[Optional[int], str]] = {}
+
+    def fetch(self, providers: List[Tuple[str, Optional[int]]]) -> List[Optional[str]]:
+        intervals = dict(providers)
+        urls = list(intervals)
+
+        entries = fetch_all(urls, lambda url: self._cache.get(url, intervals[url]), self._deadline, self._max_workers)
+
+        contents = {}
+        for url, entry in zip(urls, entries):
+            if entry:
+                self.fingerprints[url] = (intervals[url], entry.fingerprint)
+                contents[url] = entry.content
+        return [contents.get(url) for url, _ in providers]
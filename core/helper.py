@@ -1,22 +1,51 @@
 import base64
+import binascii
+import functools
+import glob
+import hashlib
 import ipaddress
 import os
 import re
 
 import requests
+import yaml
+from requests.adapters import HTTPAdapter
 from urllib3.exceptions import InsecureRequestWarning
 
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
+# 优先使用libyaml的C实现，PyYAML未编译libyaml时退回纯python实现
+try:
+    from yaml import CFullLoader as YamlLoader, CDumper as YamlDumper
+except ImportError:
+    from yaml import FullLoader as YamlLoader, Dumper as YamlDumper
+
+
+def yaml_load(content):
+    return yaml.load(content, Loader=YamlLoader)
+
+
+def yaml_dump(data):
+    return yaml.dump(data, Dumper=YamlDumper)
+
+
+# urlsafe字符转为标准字符，同时删除空白字符和原有的填充，一次translate完成
+_B64_URLSAFE = bytes.maketrans(b'-_', b'+/')
+_B64_DELETE = b' \t\r\n\x0b\x0c='
 
-def base64_decode(content):
-    content = content.strip().replace(os.linesep, '').replace('\r', '').replace('\n', '').replace(' ', '')
 
-    content_length = len(content)
-    if content_length % 4 != 0:
-        content = content.ljust(content_length + 4 - content_length % 4, "=")
+def base64_decode_bytes(content):
+    """
+    兼容标准、urlsafe、缺少填充、带换行的base64，返回解码后的bytes
+    """
+    if isinstance(content, str):
+        content = content.encode('ascii')
+    content = content.translate(_B64_URLSAFE, _B64_DELETE)
+    return binascii.a2b_base64(content + b'=' * (-len(content) % 4))
 
-    return str(base64.b64decode(content), "utf-8").strip()
+
+def base64_decode(content):
+    return base64_decode_bytes(content).decode('utf-8').strip()
 
 
 def base64_encode(content):
@@ -24,10 +53,50 @@ def base64_encode(content):
     return base64.b64encode(bytes_content).decode('utf-8')
 
 
+def base64_encode_stream(contents):
+    """
+    增量base64编码，每次只编码按3字节对齐的部分，拼接结果与base64_encode(''.join(contents))一致
+    """
+    rest = b''
+    for content in contents:
+        bytes_content = rest + content.encode(encoding='utf-8')
+        aligned = len(bytes_content) - len(bytes_content) % 3
+        rest = bytes_content[aligned:]
+        if aligned:
+            yield base64.b64encode(bytes_content[:aligned]).decode('utf-8')
+    if rest:
+        yield base64.b64encode(rest).decode('utf-8')
+
+
+def iter_chunks(contents, chunk_size):
+    """
+    将零散的小字符串合并成约chunk_size大小的块再产出，减少流式响应的发送次数
+    """
+    buffer = []
+    size = 0
+    for content in contents:
+        buffer.append(content)
+        size += len(content)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+# 含有数字和.以外字符且不含:的一定不是ip地址，不必交给ipaddress解析(解析失败抛异常开销大)
+_NOT_IP = re.compile(r'[^0-9.:]')
+
+
+@functools.lru_cache(maxsize=8192)
 def check_ip(ip):
     if ip == "1.1.1.1" or ip == "1.0.0.1" or ip == "0.0.0.0":
         return False
 
+    if isinstance(ip, str) and _NOT_IP.search(ip) and ':' not in ip:
+        return '.' in ip
+
     try:
         ip_addr = ipaddress.ip_address(ip)
         if ip_addr.is_multicast or ip_addr.is_private or ip_addr.is_loopback or ip_addr.is_link_local or ip_addr.is_reserved or ip_addr.is_unspecified:
@@ -39,50 +108,96 @@ def check_ip(ip):
     return True
 
 
+class HttpClient(object):
+    """
+    基于requests.Session的连接池客户端，每个worker进程共享一个，复用keep-alive连接
+    """
+
+    def __init__(self, proxies=None, pool_connections=20, pool_maxsize=10, pool_block=False,
+                 connect_timeout=3, read_timeout=3):
+        self.proxies = proxies
+        self.timeout = (connect_timeout, read_timeout)
+
+        # pool_connections: 缓存多少个host的连接池；pool_maxsize: 每个host保持的最大连接数
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        self._session = requests.Session()
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._session.verify = False
+        self._session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.159 Safari/537.36'})
+
+    def get(self, url, headers=None):
+        return self._session.get(url, headers=headers, proxies=self.proxies, timeout=self.timeout)
+
+    def __call__(self, url):
+        res = self.get(url)
+        sub_content = res.text.strip()
+
+        return sub_content
+
+    def close(self):
+        self._session.close()
+
+
 _request = None
 
 
-def get_request(enable_proxy=False, proxies_=None):
+def get_request(enable_proxy=False, proxies_=None, **pool_options) -> HttpClient:
     global _request
     if _request:
         return _request
     else:
-        def inner(url):
-            proxies = None
-            if enable_proxy:
-                if proxies_:
-                    proxies = proxies_
-                else:
-                    proxies = {
-                        "http": "http://127.0.0.1:7890",
-                        'https': 'http://127.0.0.1:7890'
-                    }
-
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.159 Safari/537.36'}
-            res = requests.get(url, headers=headers, proxies=proxies, verify=False, timeout=3)
-            sub_content = res.text.strip()
-
-            return sub_content
-
-        _request = inner
+        proxies = None
+        if enable_proxy:
+            if proxies_:
+                proxies = proxies_
+            else:
+                proxies = {
+                    "http": "http://127.0.0.1:7890",
+                    'https': 'http://127.0.0.1:7890'
+                }
+
+        _request = HttpClient(proxies, **pool_options)
         return _request
 
 
+def close_request():
+    global _request
+    if _request:
+        _request.close()
+        _request = None
+
+
 def remove_special_characters(content):
     return bytes(content, "ascii", "ignore").decode()
 
 
-def check_and_rename(nodes: list, name):
-    while True:
-        if name not in nodes:
-            nodes.append(name)
+class NameAllocator(object):
+    """
+    为节点分配不重复的名称，每个原始名称单独计数，每次分配O(1)
+    重复的名称依次命名为: name-重复, name-重复2, name-重复3...
+    """
+
+    def __init__(self):
+        self._used = set()
+        self._counters = {}
+
+    def allocate(self, name):
+        if name not in self._used:
+            self._used.add(name)
             return name
-        else:
-            name = name + '-重复'
-            r = check_and_rename(nodes, name)
-            if r:
-                return r
+
+        i = self._counters.get(name, 1)
+        while True:
+            new_name = f'{name}-重复' if i == 1 else f'{name}-重复{i}'
+            i += 1
+            if new_name not in self._used:
+                break
+
+        self._counters[name] = i
+        self._used.add(new_name)
+        return new_name
 
 
 def load_resources():
@@ -96,6 +211,19 @@ def load_resources():
         return list(filter(lambda x: x.strip() != "", [i.strip() for i in f.readlines()]))
 
 
+def source_fingerprint():
+    """
+    本项目python源码(含settings.py)的指纹，部署新版本后变化，同一版本的各worker相同
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    h = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(root, '*.py')) + glob.glob(os.path.join(root, 'core', '*.py'))):
+        h.update(os.path.relpath(path, root).encode('utf-8'))
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
 def save_conf(conf, dir_, filename):
     if not os.path.exists(dir_):
         os.mkdir(dir_)
@@ -105,11 +233,10 @@ def save_conf(conf, dir_, filename):
 
 
 if __name__ == '__main__':
-    a = []
-    b = check_and_rename(a, 'name')
-    c = check_and_rename(a, 'name')
-    d = check_and_rename(a, 'name')
-    print(a)
+    a = NameAllocator()
+    b = a.allocate('name')
+    c = a.allocate('name')
+    d = a.allocate('name')
     print(b)
     print(c)
     print(d)
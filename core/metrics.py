@@ -0,0 +1,83 @@
+"""
+Prometheus指标
+
+gunicorn启动多个worker时，gconfig.py会设置PROMETHEUS_MULTIPROC_DIR，各worker将指标写入该目录下的文件，
+/metrics读取目录中所有文件汇总，因此无论请求落到哪个worker，得到的都是全部worker的合计
+"""
+import os
+import threading
+import time
+from typing import Iterator, Tuple
+from urllib.parse import urlparse
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+
+# 单个订阅、单个节点的耗时都很短，整体转换可能要几十秒
+_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 20, 40)
+
+FETCH_SECONDS = Histogram('subapi_fetch_seconds', '向上游获取订阅的耗时(不含缓存命中)', ['host'], buckets=_BUCKETS)
+FETCH_ERRORS = Counter('subapi_fetch_errors_total', '获取上游订阅失败的次数', ['host', 'reason'])
+PARSE_SECONDS = Histogram('subapi_parse_seconds', '单个订阅sub_2_nodelist的耗时(含获取proxy-providers)', buckets=_BUCKETS)
+LOAD_SECONDS = Histogram('subapi_node_load_seconds', '单次转换中ProxyNode.load的总耗时', buckets=_BUCKETS)
+RENDER_SECONDS = Histogram('subapi_render_seconds', 'generate_sub的耗时', ['client'], buckets=_BUCKETS)
+NODES = Counter('subapi_nodes_total', '解析的节点个数，按加载结果区分', ['result'])
+NODE_ISSUES = Counter('subapi_node_issues_total', '已加载的节点中链接有未识别内容的次数，按问题区分', ['issue'])
+NODES_DEDUPLICATED = Counter('subapi_nodes_deduplicated_total', '去除的重复节点个数')
+CACHE_REQUESTS = Counter('subapi_cache_requests_total', '缓存查询次数，按缓存和结果区分', ['cache', 'result'])
+
+# 订阅url由用户输入，host取值不可控，每个worker最多单独统计这么多个host，其余归为other
+MAX_HOSTS = 200
+_hosts = set()
+_hosts_lock = threading.Lock()
+
+
+def host_label(url: str) -> str:
+    host = urlparse(url).hostname or ''
+    if host in _hosts:
+        return host
+    with _hosts_lock:
+        if len(_hosts) >= MAX_HOSTS:
+            return 'other'
+        _hosts.add(host)
+    return host
+
+
+def observe_parse_stats(stats, dropped: int = 0):
+    for result, count in stats.counts.items():
+        if count:
+            NODES.labels(result).inc(count)
+    for issue, count in stats.issues.items():
+        if count:
+            NODE_ISSUES.labels(issue).inc(count)
+    LOAD_SECONDS.observe(stats.load_seconds)
+    if dropped:
+        NODES_DEDUPLICATED.inc(dropped)
+
+
+def timed_iter(iterator: Iterator, histogram) -> Iterator:
+    """
+    流式生成订阅时统计耗时：只累计iterator自身产出内容的时间，不含等待发送的时间
+    """
+    elapsed = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        histogram.observe(elapsed)
+
+
+def export() -> Tuple[bytes, str]:
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Tuple
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler(object):
+    """
+    采样分析器：在后台线程中定时采样执行func的线程的调用栈，开销与函数调用次数无关
+    结果为collapsed stack格式(每行"栈帧;栈帧;... 采样数")，可直接用flamegraph.pl、speedscope查看
+    采样线程同样需要GIL，实际采样间隔受sys.getswitchinterval()影响
+    """
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.cpu_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    def run(self, func: Callable, *args) -> Any:
+        target = threading.get_ident()
+        stop = threading.Event()
+
+        def sample():
+            while not stop.wait(self.interval):
+                frame = sys._current_frames().get(target)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[';'.join(reversed(stack))] += 1
+                    self.samples += 1
+
+        sampler = threading.Thread(target=sample, name='profiler', daemon=True)
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        sampler.start()
+        try:
+            return func(*args)
+        finally:
+            self.cpu_seconds = time.thread_time() - cpu_start
+            self.wall_seconds = time.perf_counter() - wall_start
+            stop.set()
+            sampler.join()
+
+    def collapsed(self) -> str:
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+
+def profile(func: Callable, *args, interval: float = 0.001) -> Tuple[Any, StackSampler]:
+    sampler = StackSampler(interval)
+    result = sampler.run(func, *args)
+    return result, sampler
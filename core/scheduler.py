@@ -0,0 +1,82 @@
+import asyncio
+import random
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional
+
+from loguru import logger
+
+from core.cache import FetchCache, FetchEntry
+
+
+class RefreshScheduler(object):
+    """
+    后台定时刷新配置的订阅，转换请求直接使用预先获取的内容，不必等待上游
+    1. 每个订阅单独计时：优先使用proxy-providers声明的interval，其次是上游的缓存头，否则为default_interval
+    2. 间隔限制在[min_interval, max_interval]内，并按jitter比例随机浮动，避免所有订阅同时刷新
+    3. 同时刷新的订阅数不超过concurrency
+    4. warm: 刷新后在warm_executor中预先解析节点，返回订阅中引用的proxy-providers {url: interval}，一并定时刷新
+       provider只刷新内容，由引用它的订阅解析
+    """
+
+    def __init__(self, cache: FetchCache, fetch_executor: Executor, default_interval: float, min_interval: float,
+                 max_interval: float, jitter: float, concurrency: int,
+                 warm: Callable[[str, FetchEntry], Dict[str, Optional[int]]] = None,
+                 warm_executor: Optional[Executor] = None):
+        self._cache = cache
+        self._fetch_executor = fetch_executor
+        self._warm = warm
+        self._warm_executor = warm_executor
+        self.default_interval = default_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.concurrency = concurrency
+
+        self._semaphore = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def start(self, urls: List[str]):
+        # 需在事件循环中调用
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        logger.info(f'开始定时刷新{len(urls)}个订阅')
+        for url in urls:
+            # 启动时在一个默认间隔内错开
+            self.add(url, delay=random.uniform(0, min(self.default_interval, self.max_interval) * self.jitter))
+
+    def add(self, url: str, interval: Optional[int] = None, delay: float = 0, warm: bool = True):
+        if url not in self._tasks:
+            self._tasks[url] = asyncio.ensure_future(self._run(url, interval, delay, warm))
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, url: str, interval: Optional[int], delay: float, warm: bool):
+        await asyncio.sleep(delay)
+        while True:
+            try:
+                entry = await self._refresh(url, warm)
+                next_interval = interval or entry.max_age or self.default_interval
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f'定时刷新订阅出错: {url} {e}')
+                next_interval = self.min_interval
+
+            next_interval = min(max(next_interval, self.min_interval), self.max_interval)
+            await asyncio.sleep(next_interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    async def _refresh(self, url: str, warm: bool) -> FetchEntry:
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            logger.debug(f'定时刷新订阅: {url}')
+            # 其他worker在min_interval内刚刷新过时不再请求上游
+            entry = await loop.run_in_executor(self._fetch_executor, self._cache.refresh, url, self.min_interval)
+            if warm and self._warm is not None:
+                providers = await loop.run_in_executor(self._warm_executor, self._warm, url, entry)
+                for provider_url, provider_interval in providers.items():
+                    self.add(provider_url, provider_interval, warm=False)
+        return entry
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class SingleFlight(object):
+    """
+    合并相同key的并发调用(线程)：第一个调用者执行func，执行期间其余调用者等待并共享其结果或异常
+    执行结束后即移除，之后的调用会重新执行
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """
+        timeout: 等待其他调用者执行结果的超时时间(秒)，超时抛出concurrent.futures.TimeoutError
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result(timeout)
+
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight(object):
+    """
+    SingleFlight的协程版本：func在单独的task中执行，某个调用者超时或断开连接不会取消其他调用者在等待的执行
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable], *args, timeout: Optional[float] = None) -> Any:
+        """
+        timeout: 本调用者的等待超时时间(秒)，超时抛出asyncio.TimeoutError
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args))
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        self._tasks.pop(key, None)
+        if not task.cancelled():
+            # 所有调用者都已超时的情况下，避免asyncio报告异常未被获取
+            task.exception()
+
+    def __contains__(self, key: Hashable):
+        return key in self._tasks
@@ -0,0 +1,42 @@
+import random
+
+# 节点加载结果
+PARSED = 'parsed'
+INVALID_IP = 'invalid_ip'
+UNSUPPORTED = 'unsupported'
+INVALID = 'invalid'
+
+# 节点已加载，但链接中有部分内容未能识别
+UNKNOWN_PARAM = 'unknown_param'
+INSECURE_FLAG = 'insecure_flag'
+MALFORMED_PORT = 'malformed_port'
+
+
+class ParseStats(object):
+    """
+    单次转换的节点解析统计，代替逐个节点打印日志
+    sample_rate>0时按比例抽样打印节点详情，用于排查问题
+    """
+    __slots__ = ('counts', 'issues', 'sample_rate', 'load_seconds')
+
+    def __init__(self, sample_rate: float = 0):
+        self.counts = {PARSED: 0, INVALID_IP: 0, UNSUPPORTED: 0, INVALID: 0}
+        self.issues = {UNKNOWN_PARAM: 0, INSECURE_FLAG: 0, MALFORMED_PORT: 0}
+        self.sample_rate = sample_rate
+        self.load_seconds = 0.0  # 所有节点加载的总耗时
+
+    def add(self, result: str, elapsed: float = 0.0):
+        self.counts[result] += 1
+        self.load_seconds += elapsed
+
+    def note(self, issue: str):
+        self.issues[issue] += 1
+
+    def sampled(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __str__(self):
+        return (f'解析成功: {self.counts[PARSED]}, ip不合法: {self.counts[INVALID_IP]}, '
+                f'无法识别: {self.counts[UNSUPPORTED]}, 格式错误: {self.counts[INVALID]}, '
+                f'未识别参数: {self.issues[UNKNOWN_PARAM]}, allowInsecure未识别: {self.issues[INSECURE_FLAG]}, '
+                f'端口含特殊字符: {self.issues[MALFORMED_PORT]}')
@@ -0,0 +1,198 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from core.cache import FetchEntry
+from core.compress import BROTLI, GZIP
+from core.config_model import ProxyNode
+
+# 表结构变化时加1，打开旧版本的文件时清空重建(其中只有缓存数据)
+_SCHEMA_VERSION = 4
+
+_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS subscription (
+        url TEXT PRIMARY KEY,
+        content TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        fetched_at REAL NOT NULL,
+        max_age INTEGER,
+        nodes TEXT,
+        size INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS subscription_fetched_at ON subscription (fetched_at);
+    CREATE TABLE IF NOT EXISTS rendered (
+        key TEXT PRIMARY KEY,
+        body TEXT NOT NULL,
+        headers TEXT NOT NULL,
+        providers TEXT,
+        gzip BLOB,
+        br BLOB,
+        created_at REAL NOT NULL,
+        size INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS rendered_created_at ON rendered (created_at);
+'''
+
+# 数据库及WAL模式下的附属文件
+_DB_SUFFIXES = ('', '-wal', '-shm')
+
+# 按时间从新到旧累计大小，超出max_bytes的部分删除
+_EVICT = '''
+    DELETE FROM {table} WHERE {key} IN (
+        SELECT {key} FROM (
+            SELECT {key}, SUM(size) OVER (ORDER BY {time} DESC, {key}) AS total FROM {table}
+        ) WHERE total > ?
+    )
+'''
+
+
+class SubStore(object):
+    """
+    同一台机器上所有worker共享的本地存储(SQLite，WAL模式)
+    1. subscription: 每个订阅url最后一次获取的内容及解析后的节点，进程重启、新worker启动后可直接使用，
+       一个worker获取到的新内容其他worker也能直接使用，不必各自请求上游；节点与内容指纹一起保存，内容变化后自动失效
+    2. rendered: 渲染完成的订阅及其压缩后的内容
+    WAL模式下读不阻塞写，每个线程使用自己的连接，读取时不加锁；每次写入在一个事务中完成，
+    其他worker要么读到写入前、要么读到写入后的完整内容；两张表分别按字节数上限淘汰最早写入的条目
+    """
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None, rendered_max_bytes: Optional[int] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rendered_max_bytes = rendered_max_bytes
+
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        # 保存的订阅url可直接获取订阅，节点含有凭据，只允许本用户读写
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+
+        conn = self._conn()
+        with conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] != _SCHEMA_VERSION:
+                conn.execute('DROP TABLE IF EXISTS subscription')
+                conn.execute('DROP TABLE IF EXISTS rendered')
+                conn.execute(f'PRAGMA user_version = {_SCHEMA_VERSION}')
+        conn.executescript(_SCHEMA)
+        for suffix in _DB_SUFFIXES:
+            if os.path.exists(path + suffix):
+                os.chmod(path + suffix, 0o600)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def load(self, url: str, newer_than: float = 0) -> Optional[FetchEntry]:
+        """
+        newer_than: 只返回在该时间之后获取的内容，用于判断其他worker是否已经刷新过
+        """
+        row = self._conn().execute(
+            'SELECT content, etag, last_modified, fetched_at, max_age FROM subscription '
+            'WHERE url = ? AND fetched_at > ?', (url, newer_than)).fetchone()
+        if row is None:
+            return None
+        entry = FetchEntry(*row[:4])
+        entry.max_age = row[4]
+        return entry
+
+    def load_nodes(self, url: str, fingerprint: str) -> Optional[List[ProxyNode]]:
+        row = self._conn().execute(
+            'SELECT nodes FROM subscription WHERE url = ? AND fingerprint = ?', (url, fingerprint)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return [ProxyNode.from_fields(i) for i in json.loads(row[0])]
+
+    def save(self, url: str, entry: FetchEntry):
+        conn = self._conn()
+        with conn:
+            # 内容未变化时保留已保存的节点
+            conn.execute('''
+                INSERT INTO subscription (url, content, fingerprint, etag, last_modified, fetched_at, max_age, size)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    nodes = CASE WHEN fingerprint = excluded.fingerprint THEN nodes END,
+                    size = CASE WHEN fingerprint = excluded.fingerprint THEN size ELSE excluded.size END,
+                    content = excluded.content,
+                    fingerprint = excluded.fingerprint,
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    fetched_at = excluded.fetched_at,
+                    max_age = excluded.max_age''',
+                (url, entry.content, entry.fingerprint, entry.etag, entry.last_modified, entry.fetched_at,
+                 entry.max_age, entry.size))
+            self._evict(conn, 'subscription', 'url', 'fetched_at', self.max_bytes)
+
+    def save_nodes(self, url: str, fingerprint: str, nodes: List[ProxyNode]):
+        data = json.dumps([i.to_fields() for i in nodes], ensure_ascii=False)
+        conn = self._conn()
+        with conn:
+            # 内容已被更新时不覆盖
+            conn.execute('UPDATE subscription SET nodes = ?, size = length(CAST(content AS BLOB)) + ? '
+                         'WHERE url = ? AND fingerprint = ?', (data, len(data.encode('utf-8')), url, fingerprint))
+            self._evict(conn, 'subscription', 'url', 'fetched_at', self.max_bytes)
+
+    def touch(self, url: str, fetched_at: float, max_age: Optional[int] = None):
+        conn = self._conn()
+        with conn:
+            conn.execute('UPDATE subscription SET fetched_at = ?, max_age = COALESCE(?, max_age) '
+                         'WHERE url = ? AND fetched_at < ?', (fetched_at, max_age, url, fetched_at))
+
+    def load_rendered(self, key: str) -> Optional[Tuple[str, dict, Optional[dict], Dict[str, bytes]]]:
+        row = self._conn().execute('SELECT body, headers, providers, gzip, br FROM rendered WHERE key = ?',
+                                   (key,)).fetchone()
+        if row is None:
+            return None
+        body, headers, providers, gzip, br = row
+        encoded = {k: v for k, v in ((GZIP, gzip), (BROTLI, br)) if v is not None}
+        return body, json.loads(headers), json.loads(providers) if providers else None, encoded
+
+    def save_rendered(self, key: str, body: str, headers: dict, providers: Optional[dict],
+                      encoded: Dict[str, bytes], size: int):
+        conn = self._conn()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO rendered (key, body, headers, providers, gzip, br, created_at, size) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (key, body, json.dumps(headers, ensure_ascii=False),
+                          json.dumps(providers) if providers else None, encoded.get(GZIP), encoded.get(BROTLI),
+                          time.time(), size))
+            self._evict(conn, 'rendered', 'key', 'created_at', self.rendered_max_bytes)
+
+    @staticmethod
+    def _evict(conn: sqlite3.Connection, table: str, key: str, time_column: str, max_bytes: Optional[int]):
+        if max_bytes is not None:
+            conn.execute(_EVICT.format(table=table, key=key, time=time_column), (max_bytes,))
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+def open_store(path: str, max_bytes: Optional[int] = None,
+               rendered_max_bytes: Optional[int] = None) -> Optional[SubStore]:
+    if not path:
+        return None
+    try:
+        return SubStore(path, max_bytes, rendered_max_bytes)
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f'打开本地订阅存储失败，不再持久化: {path} {e}')
+        return None
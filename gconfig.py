@@ -1,5 +1,7 @@
 import multiprocessing
 import os
+import shutil
+import tempfile
 
 # 协程需要此补丁
 # form gevent import monkey
@@ -35,3 +37,19 @@ loglevel = 'info'
 
 # reload=true 自动重启
 # chdir = '/path/' 指定它的工作路径
+
+# 多个worker进程的prometheus指标写入同一目录，/metrics汇总后返回
+prometheus_multiproc_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR') or os.path.join(tempfile.gettempdir(), 'ml-sub-metrics')
+os.environ['PROMETHEUS_MULTIPROC_DIR'] = prometheus_multiproc_dir
+
+
+def on_starting(server):
+    # 清除上次运行残留的指标文件
+    shutil.rmtree(prometheus_multiproc_dir, ignore_errors=True)
+    os.makedirs(prometheus_multiproc_dir)
+
+
+def child_exit(server, worker):
+    # worker退出后清理其指标文件，计数器的值仍保留在汇总中
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,25 +1,56 @@
+import asyncio
+import os
 import re
 import sys
-from typing import Union, List
-from urllib.parse import unquote
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, List, Dict, Optional, Iterator, AsyncIterator, Tuple
+from urllib.parse import unquote, urlencode
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Query
 from loguru import logger
 from starlette.requests import Request
-from starlette.responses import PlainTextResponse
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
 from starlette.templating import Jinja2Templates
 
 import settings
+from core import compress, metrics, profiler
 from core.config_model import ProxyNode
-from core.converter import change_host, sub_2_nodelist, generate_sub
-from core.helper import get_request
+from core.dedup import NodeIndex
+from core.converter import change_host, sub_2_nodelist, generate_sub_stream, STREAM_CLIENTS
+from core.cache import FetchCache, FetchEntry, RenderCache, RenderedSub, matching_etag, render_key, sub_etag
+from core.fetcher import ProviderResolver, fetch_all_async, get_executor, shutdown_executor
+from core.helper import get_request, close_request, iter_chunks, load_resources, source_fingerprint
+from core.scheduler import RefreshScheduler
+from core.singleflight import AsyncSingleFlight, SingleFlight
+from core.store import open_store
+from core.stats import ParseStats
 
 # 设置日志
 logger_level = settings.log_level
 logger.remove()
 logger.add(sys.stdout, level=logger_level)
 
-request = get_request(settings.enable_proxy, settings.proxies)
+request = get_request(settings.enable_proxy, settings.proxies,
+                      pool_connections=settings.http_pool_connections,
+                      pool_maxsize=settings.http_pool_maxsize,
+                      pool_block=settings.http_pool_block,
+                      connect_timeout=settings.http_connect_timeout,
+                      read_timeout=settings.http_read_timeout)
+store = open_store(settings.store_path, settings.store_max_bytes, settings.store_rendered_max_bytes)
+# 本地存储的读写单独放在该线程池中执行，不与获取订阅争用线程
+store_executor = ThreadPoolExecutor(max_workers=settings.store_workers, thread_name_prefix='store')
+fetch_cache = FetchCache(request.get, settings.fetch_cache_ttl, settings.fetch_cache_max_stale,
+                         settings.fetch_cache_max_bytes, get_executor(settings.fetch_workers), store, store_executor)
+render_cache = RenderCache(settings.render_cache_max_entries, settings.render_cache_max_bytes, store, store_executor)
+# 解析、渲染等CPU密集的步骤单独放在该线程池中执行，不阻塞事件循环
+render_executor = ThreadPoolExecutor(max_workers=settings.render_workers, thread_name_prefix='render')
+scheduler = None
+# 同一订阅内容同时只解析一次，相同的转换同时只执行一次
+parses = SingleFlight()
+conversions = AsyncSingleFlight()
+# 部署新版本后生成的订阅可能不同，源码指纹作为渲染缓存key(即ETag)的一部分，旧的缓存和客户端持有的ETag随之失效
+source_version = source_fingerprint()
 
 app = FastAPI()
 template = Jinja2Templates('templates')
@@ -30,75 +61,426 @@ clients = [
     "Leaf",
     "Surfboard"
 ]
+index_page = None
 
 
-def resolve_proxies(proxies: Union[str, List]) -> List:
+async def fetch_subscriptions(proxies: List[str]) -> Dict[str, Optional[FetchEntry]]:
+    sub_urls = list(dict.fromkeys(i for i in proxies if i.startswith("http")))
+    logger.info(f"开始并发获取{len(sub_urls)}个订阅的内容")
+    entries = await fetch_all_async(sub_urls, fetch_cache.get, settings.fetch_deadline, settings.fetch_workers)
+    return dict(zip(sub_urls, entries))
+
+
+async def providers_changed(providers: Dict[str, Tuple[Optional[int], str]]) -> bool:
+    """
+    缓存的订阅用到的proxy-providers内容是否有变化，provider仍在缓存有效期内时不会发起请求
+    """
+    urls = list(providers)
+    entries = await fetch_all_async(urls, lambda url: fetch_cache.get(url, providers[url][0]),
+                                    settings.provider_deadline, settings.fetch_workers)
+    return any(entry is None or entry.fingerprint != providers[url][1] for url, entry in zip(urls, entries))
+
+
+def parse_subscription(url: str, entry: FetchEntry, stats: ParseStats = None,
+                       resolver: ProviderResolver = None, use_cache: bool = True) -> List:
+    logger.debug("获取订阅{}的内容为: {}", url, entry.content)
+    with metrics.PARSE_SECONDS.time():
+        nodes = sub_2_nodelist(entry.content, stats, resolver, visited=frozenset([url]))
+    # proxy-providers的内容单独缓存，包含provider的订阅每次都需重新解析
+    if use_cache and 'proxy-providers' not in entry.content:
+        fetch_cache.set_nodes(url, entry, nodes)
+    return nodes
+
+
+def resolve_proxies(proxies: Union[str, List], sub_entries: Dict[str, Optional[FetchEntry]],
+                    stats: ParseStats = None, resolver: ProviderResolver = None,
+                    index: NodeIndex = None, use_cache: bool = True) -> List:
+    """
+    index: 传入时节点经其去重后再合并
+    use_cache: 为False时不使用也不保存已解析的节点，每个订阅都重新解析(性能分析)
+    """
     if isinstance(proxies, str):
         proxies = [proxies]
 
-    nodes = []
+    proxies = [i.strip() for i in proxies if isinstance(i, str)]
+
+    nodes = index if index is not None else []
     for i in proxies:
-        if isinstance(i, str):
-            i = i.strip()
-            if i.startswith("http"):
-                logger.info(f"开始获取订阅{i}的内容")
-                try:
-                    sub_content = request(i)
-                    logger.debug(f"获取订阅的内容为: {sub_content}")
-                except Exception as e:
-                    logger.error(f"获取订阅内容出错: {e}")
-                    continue
-
-                if sub_content:
-                    node_list = sub_2_nodelist(sub_content)
-                    logger.info(f"订阅中节点个数：{len(node_list)}，来自订阅--> {i}")
-                    nodes.extend(node_list)
-            else:
-                pn = ProxyNode()
-                logger.info(f"v2节点，直接添加: {i}")
-                if pn.load(i):
-                    nodes.append(pn)
+        if i.startswith("http"):
+            entry = sub_entries.get(i)
+            if entry:
+                node_list = fetch_cache.get_nodes(i, entry) if use_cache else None
+                if node_list is not None:
+                    logger.info("订阅内容未变化，使用已解析的节点")
+                elif not use_cache:
+                    node_list = parse_subscription(i, entry, stats, resolver, use_cache=False)
+                elif 'proxy-providers' in entry.content:
+                    # 需要记录本次转换用到的provider，单独解析
+                    node_list = parse_subscription(i, entry, stats, resolver)
+                else:
+                    node_list = parses.do((i, entry.fingerprint), parse_subscription, i, entry, stats, resolver)
+                logger.info(f"订阅中节点个数：{len(node_list)}，来自订阅--> {i}")
+                nodes.extend(node_list)
+        else:
+            pn = ProxyNode()
+            logger.info(f"v2节点，直接添加: {i}")
+            if pn.load(i, stats):
+                nodes.append(pn)
+    return index.nodes if index is not None else nodes
+
+
+def prepare_nodes(input_list: List[str], sub_entries: Dict[str, Optional[FetchEntry]], host: str,
+                  resolver: ProviderResolver = None, use_cache: bool = True) -> List:
+    """
+    解析节点并替换host，CPU密集，需在渲染线程池中执行
+    """
+    stats = ParseStats(settings.node_log_sample_rate)
+    index = NodeIndex(settings.dedup_policy) if settings.dedup_policy else None
+    nodes = resolve_proxies(input_list, sub_entries, stats, resolver, index, use_cache)
+
+    logger.info(f"节点解析统计: {stats}")
+    if index is not None:
+        logger.info(f"去除重复节点个数: {index.dropped}")
+    metrics.observe_parse_stats(stats, index.dropped if index is not None else 0)
+    logger.info(f"用户输入总节点个数为: {len(nodes)}")
+
+    if nodes and host:
+        logger.info(f"将过滤完的节点的host用{host}替换")
+        nodes = change_host(nodes, host)
     return nodes
 
 
+def render(nodes: List, host: str, client: str, managed_url: str) -> str:
+    with metrics.RENDER_SECONDS.labels(client_label(client)).time():
+        return ''.join(render_stream(nodes, host, client, managed_url))
+
+
+def render_stream(nodes: List, host: str, client: str, managed_url: str) -> Iterator[str]:
+    if host:
+        logger.info(f'开始生成免流{client}订阅')
+    else:
+        logger.info(f'开始生成{client}订阅')
+
+    if client == 'Surfboard':
+        yield f'#!MANAGED-CONFIG {managed_url} interval=60 strict=true\r\n'
+    yield from generate_sub_stream(nodes, client, bool(host))
+
+
+def client_label(client: str) -> str:
+    # client由用户输入，只统计支持的客户端
+    return client if client in clients else 'other'
+
+
+async def run_in_render_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(render_executor, func, *args)
+
+
+async def iterate_in_render_executor(iterator: Iterator[str]) -> AsyncIterator[str]:
+    while True:
+        chunk = await run_in_render_executor(next, iterator, None)
+        if chunk is None:
+            break
+        yield chunk
+
+
+def profile_conversion(input_list: List[str], sub_entries: Dict[str, Optional[FetchEntry]], host: str, client: str,
+                       managed_url: str, resolver: ProviderResolver) -> profiler.StackSampler:
+    def convert():
+        # 不使用已解析的节点，采样中包含完整的解析过程
+        nodes = prepare_nodes(input_list, sub_entries, host, resolver, use_cache=False)
+        return render(nodes, host, client, managed_url) if nodes else ''
+
+    _, sampler = profiler.profile(convert, interval=settings.profile_interval)
+    return sampler
+
+
+def profile_report(url: str, fetch_seconds: float, sampler: profiler.StackSampler) -> str:
+    return '\n'.join([
+        f'# 转换内容: {url}',
+        f'# 获取订阅耗时(墙钟): {fetch_seconds:.3f}s，不在下面的采样中',
+        '# 不使用已解析的节点和渲染缓存，完整执行一次解析与生成',
+        f'# 解析与生成耗时(墙钟): {sampler.wall_seconds:.3f}s，CPU: {sampler.cpu_seconds:.3f}s，'
+        f'采样数: {sampler.samples}，采样间隔: {sampler.interval}s',
+        '# proxy-providers在解析时获取，其等待时间计入墙钟耗时和采样，不计入CPU耗时',
+        sampler.collapsed(),
+        ''
+    ])
+
+
+def save_profile(report: str) -> str:
+    os.makedirs(settings.profile_dir, exist_ok=True)
+    path = os.path.join(settings.profile_dir, f'profile-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.txt')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(report)
+    return path
+
+
+def warm_subscription(url: str, entry: FetchEntry) -> Dict[str, Optional[int]]:
+    """
+    定时刷新后预先解析节点，返回订阅中引用的proxy-providers {url: interval}
+    """
+    if fetch_cache.get_nodes(url, entry) is not None:
+        return {}
+
+    resolver = ProviderResolver(fetch_cache, settings.provider_deadline, settings.fetch_workers,
+                                settings.provider_max_depth)
+    if 'proxy-providers' in entry.content:
+        parse_subscription(url, entry, None, resolver)
+    else:
+        parses.do((url, entry.fingerprint), parse_subscription, url, entry, None, resolver)
+    return {i: interval for i, (interval, _) in resolver.fingerprints.items()}
+
+
+def configured_subscriptions() -> List[str]:
+    try:
+        resources = load_resources()
+    except FileNotFoundError:
+        return []
+    return list(dict.fromkeys(i.strip() for i in resources if i.strip().startswith('http')))
+
+
+@app.on_event("startup")
+async def startup():
+    global scheduler
+    urls = configured_subscriptions() if settings.refresh_enabled else []
+    if urls:
+        scheduler = RefreshScheduler(fetch_cache, get_executor(settings.fetch_workers),
+                                     settings.refresh_default_interval, settings.refresh_min_interval,
+                                     settings.refresh_max_interval, settings.refresh_jitter,
+                                     settings.refresh_concurrency, warm_subscription, render_executor)
+        scheduler.start(urls)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # worker退出时停止定时刷新，关闭连接池和线程池
+    if scheduler is not None:
+        await scheduler.stop()
+    shutdown_executor()
+    render_executor.shutdown(wait=False, cancel_futures=True)
+    # 等待尚未完成的写入
+    store_executor.shutdown(wait=True)
+    close_request()
+    if store is not None:
+        store.close()
+
+
+def parse_input(url: str) -> List[str]:
+    node_content = url.strip().replace(' ', "")
+    node_content = unquote(node_content)
+    return [i.strip() for i in re.split('\\|', node_content)]
+
+
+async def get_rendered(key: str) -> Optional[RenderedSub]:
+    rendered = render_cache.get_local(key)
+    if rendered is None and render_cache.shared:
+        # 共享存储的读取可能较慢(大body、等待锁)，不在事件循环中执行
+        loop = asyncio.get_running_loop()
+        rendered = await loop.run_in_executor(store_executor, render_cache.get, key)
+    if rendered and rendered.providers and await providers_changed(rendered.providers):
+        logger.info('proxy-providers内容有变化，重新生成订阅')
+        rendered = None
+    metrics.CACHE_REQUESTS.labels('render', 'hit' if rendered else 'miss').inc()
+    return rendered
+
+
+def sub_key(input_list: List[str], sub_entries: Dict[str, Optional[FetchEntry]], host: str, client: str,
+            managed_url: Optional[str]) -> str:
+    fingerprints = [i.fingerprint if i else None for i in sub_entries.values()]
+    return render_key(input_list, fingerprints, host, client, managed_url, source_version)
+
+
+def sub_headers(etag: str) -> Dict[str, str]:
+    return {'Content-Disposition': 'filename=subapi', 'profile-update-interval': "2", 'ETag': etag}
+
+
+def not_modified(req: Request, etag: Optional[str]) -> Optional[Response]:
+    # 客户端持有的订阅未变化时返回304，不再返回body
+    matched = matching_etag(req.headers.get('if-none-match'), etag)
+    if matched:
+        logger.info('订阅内容未变化，返回304')
+        return Response(status_code=304, headers={'ETag': matched, 'Vary': 'Accept-Encoding'})
+    return None
+
+
+def encode_body(body: str) -> Dict[str, bytes]:
+    return compress.compress_all(body.encode('utf-8'), settings.compress_min_size, settings.compress_levels)
+
+
+def encoded_response(req: Request, rendered: RenderedSub, media_type: str = 'text/plain') -> Response:
+    """
+    按Accept-Encoding返回缓存的压缩内容，客户端不接受压缩或内容太小未压缩时返回原内容
+    """
+    headers = dict(rendered.headers, Vary='Accept-Encoding')
+    encoding = compress.negotiate(req.headers.get('accept-encoding'), rendered.encoded)
+    if encoding is None:
+        return Response(rendered.body, headers=headers, media_type=media_type)
+    headers['Content-Encoding'] = encoding
+    if 'ETag' in headers:
+        headers['ETag'] = compress.encoded_etag(headers['ETag'], encoding)
+    return Response(rendered.encoded[encoding], headers=headers, media_type=media_type)
+
+
+async def convert(key: str, input_list: List[str], sub_entries: Dict[str, Optional[FetchEntry]], host: str,
+                  client: str, managed_url: str) -> Union[RenderedSub, Tuple[List, Dict], None]:
+    """
+    解析并生成订阅，放入渲染缓存；没有节点时返回None
+    节点数达到流式返回的条件时不生成，返回节点及用到的proxy-providers，由各请求自行流式生成
+    """
+    resolver = ProviderResolver(fetch_cache, settings.provider_deadline, settings.fetch_workers,
+                                settings.provider_max_depth)
+    nodes = await run_in_render_executor(prepare_nodes, input_list, sub_entries, host, resolver)
+    if not nodes:
+        return None
+    if client in STREAM_CLIENTS and len(nodes) >= settings.stream_min_nodes:
+        return nodes, resolver.fingerprints
+
+    conf = await run_in_render_executor(render, nodes, host, client, managed_url)
+    encoded = await run_in_render_executor(encode_body, conf)
+    rendered = RenderedSub(conf, sub_headers(sub_etag(key, resolver.fingerprints)), resolver.fingerprints, encoded)
+    render_cache.set(key, rendered)
+    return rendered
+
+
 @app.get("/sub")
-def sub(req: Request, url: str, host: str, client: str):
+async def sub(req: Request, url: str, host: str, client: str, profile: bool = False):
     print(req.url)
     logger.info(f"用户需要转换的内容：{url}")
-    node_content = url.strip().replace(' ', "")
-    node_content = unquote(node_content)
-    input_list = re.split('\\|', node_content)
+    input_list = parse_input(url)
 
-    nodes = resolve_proxies(input_list)
+    fetch_start = time.perf_counter()
+    sub_entries = await fetch_subscriptions(input_list)
+    fetch_seconds = time.perf_counter() - fetch_start
 
-    logger.info(f"用户输入总节点个数为: {len(nodes)}")
+    # Surfboard的配置中带有请求url，需一并作为key
+    managed_url = str(req.url) if client == 'Surfboard' else None
 
-    if nodes:
-        if host:
-            logger.info(f"将过滤完的节点的host用{host}替换")
-            change_host(nodes, host)
+    if profile:
+        if settings.enable_profile:
+            # 不使用渲染缓存，完整执行一次解析和生成
+            logger.info('对本次转换进行性能分析')
+            resolver = ProviderResolver(fetch_cache, settings.provider_deadline, settings.fetch_workers,
+                                        settings.provider_max_depth)
+            sampler = await run_in_render_executor(profile_conversion, input_list, sub_entries, host, client,
+                                                   managed_url, resolver)
+            report = profile_report(url, fetch_seconds, sampler)
+            if settings.profile_dir:
+                logger.info(f'性能分析结果已保存到: {save_profile(report)}')
+            return PlainTextResponse(report)
+        logger.warning('未开启性能分析(环境变量ML_SUB_PROFILE)，忽略profile参数')
 
-            logger.info(f'开始生成免流{client}订阅')
-            conf = generate_sub(nodes, client, True)
+    key = sub_key(input_list, sub_entries, host, client, managed_url)
+    # 没有用到proxy-providers的订阅，ETag只取决于key，客户端持有的订阅未变化时不必查找缓存和渲染
+    response = not_modified(req, sub_etag(key))
+    if response:
+        return response
+
+    rendered = await get_rendered(key)
+    if rendered:
+        logger.info(f'订阅内容未变化，直接返回缓存的{client}订阅')
+        return not_modified(req, rendered.headers.get('ETag')) or encoded_response(req, rendered)
+
+    if key in conversions:
+        logger.info('相同的转换正在进行，等待其结果')
+    try:
+        result = await conversions.do(key, convert, key, input_list, sub_entries, host, client, managed_url,
+                                      timeout=settings.conversion_timeout)
+    except asyncio.TimeoutError:
+        logger.error(f'等待订阅转换超时({settings.conversion_timeout}s)')
+        return PlainTextResponse('订阅转换超时', status_code=504)
+
+    if isinstance(result, RenderedSub):
+        return not_modified(req, result.headers.get('ETag')) or encoded_response(req, result)
+    if result:
+        # 节点很多时流式返回，不再整体拼接订阅，也不放入渲染缓存
+        nodes, providers = result
+        etag = sub_etag(key, providers)
+        response = not_modified(req, etag)
+        if response:
+            return response
+        logger.info(f'节点个数{len(nodes)}，流式返回{client}订阅')
+        stream = metrics.timed_iter(render_stream(nodes, host, client, managed_url),
+                                    metrics.RENDER_SECONDS.labels(client_label(client)))
+        chunks = iter_chunks(stream, settings.stream_chunk_size)
+        encoding = compress.negotiate(req.headers.get('accept-encoding'))
+        headers = dict(sub_headers(compress.encoded_etag(etag, encoding)), Vary='Accept-Encoding')
+        if encoding:
+            # 流式返回的内容不缓存，边生成边压缩
+            chunks = compress.compress_stream(chunks, encoding, settings.compress_levels.get(encoding))
+            headers['Content-Encoding'] = encoding
+        return StreamingResponse(iterate_in_render_executor(chunks), media_type='text/plain', headers=headers)
+
+
+def render_variants(nodes: List, variants: List[Tuple[str, str]], managed_urls: Dict[Tuple[str, str], str],
+                    keys: Dict[Tuple[str, str], str], providers: Dict[str, Tuple[Optional[int], str]]) -> Dict[Tuple[str, str], RenderedSub]:
+    """
+    用同一份节点生成多个(client, host)组合的订阅，每个host只替换一次
+    """
+    results = {}
+    for host in dict.fromkeys(h for _, h in variants):
+        host_nodes = change_host(nodes, host) if host else nodes
+        for client, h in variants:
+            if h == host:
+                conf = render(host_nodes, host, client, managed_urls[(client, host)])
+                results[(client, host)] = RenderedSub(conf, sub_headers(sub_etag(keys[(client, host)], providers)),
+                                                      providers, encode_body(conf))
+    return results
+
+
+@app.get("/batch")
+async def batch(req: Request, url: str, client: List[str] = Query(...), host: List[str] = Query([''])):
+    """
+    同一输入一次生成多个客户端、多个免流host的订阅，订阅只获取和解析一次，以json返回
+    client、host均可重复传入，host为空字符串时生成不免流的订阅
+    生成的订阅同时放入渲染缓存，之后相同参数的/sub请求可直接使用
+    """
+    logger.info(f"用户需要批量转换的内容：{url}")
+    unsupported = [i for i in client if i not in clients]
+    if unsupported:
+        return PlainTextResponse(f'不支持的客户端: {",".join(unsupported)}', status_code=400)
+
+    input_list = parse_input(url)
+    sub_entries = await fetch_subscriptions(input_list)
+
+    variants = [(c, h) for h in dict.fromkeys(host) for c in dict.fromkeys(client)]
+    # Surfboard的配置中带有自身的更新地址，使用等价的/sub请求url
+    managed_urls = {(c, h): f'{req.base_url}sub?{urlencode({"url": url, "host": h, "client": c})}'
+                    if c == 'Surfboard' else None for c, h in variants}
+    keys = {(c, h): sub_key(input_list, sub_entries, h, c, managed_urls[(c, h)]) for c, h in variants}
+
+    results = {}
+    for variant, key in keys.items():
+        rendered = await get_rendered(key)
+        if rendered:
+            results[variant] = rendered
+
+    missing = [i for i in variants if i not in results]
+    if missing:
+        resolver = ProviderResolver(fetch_cache, settings.provider_deadline, settings.fetch_workers,
+                                    settings.provider_max_depth)
+        nodes = await run_in_render_executor(prepare_nodes, input_list, sub_entries, '', resolver)
+        if nodes:
+            rendered = await run_in_render_executor(render_variants, nodes, missing, managed_urls, keys,
+                                                    resolver.fingerprints)
+            for variant, i in rendered.items():
+                render_cache.set(keys[variant], i)
+            results.update(rendered)
+
+    return {'subs': [{'client': c, 'host': h, 'body': results[(c, h)].body} for c, h in variants if (c, h) in results]}
 
-            if client == 'Surfboard':
-                conf = f'#!MANAGED-CONFIG {req.url} interval=60 strict=true\r\n{conf}'
-            return PlainTextResponse(conf,
-                                     headers={'Content-Disposition': 'filename=subapi', 'profile-update-interval': "2"})
-        else:
-            logger.info(f'开始生成{client}订阅')
-            conf = generate_sub(nodes, client)
 
-            if client == 'Surfboard':
-                conf = f'#!MANAGED-CONFIG {req.url} interval=60 strict=true\r\n{conf}'
-            return PlainTextResponse(conf,
-                                     headers={'Content-Disposition': 'filename=subapi', 'profile-update-interval': "2"})
+@app.get("/metrics")
+def metrics_endpoint():
+    data, content_type = metrics.export()
+    return Response(data, media_type=content_type)
 
 
 @app.get("/")
 def index(req: Request):
-    data = {
-        "request": req,
-        "clients": clients
-    }
-    return template.TemplateResponse('index.html', data)
+    global index_page
+    if index_page is None:
+        # 页面内容不随请求变化，只生成和压缩一次
+        body = template.get_template('index.html').render(clients=clients)
+        index_page = RenderedSub(body, {}, encoded=encode_body(body))
+    return encoded_response(req, index_page, 'text/html')
@@ -1,3 +1,5 @@
+import os
+
 log_level = "INFO"  #"DEBUG"  #
 
 enable_proxy = True if log_level == 'DEBUG' else False
@@ -6,3 +8,83 @@ proxies = {
     "http": "socks5://127.0.0.1:1086",
     'https': 'socks5://127.0.0.1:1086'
 }
+
+# 并发获取订阅的最大线程数
+fetch_workers = 16
+# 解析和生成订阅的线程数
+render_workers = 4
+# 单次转换获取全部订阅的总超时时间(秒)，与provider_deadline之和需小于gconfig.py中的timeout
+fetch_deadline = 25
+# 获取clash订阅中每一层proxy-providers的总超时时间(秒)
+provider_deadline = 10
+# proxy-providers最多嵌套的层数
+provider_max_depth = 2
+# 单个请求等待解析和生成订阅的超时时间(秒)，相同的并发转换共享一次执行，每个请求各自计时
+conversion_timeout = 30
+
+# 订阅缓存有效期(秒)
+fetch_cache_ttl = 300
+# 缓存过期后仍可先返回旧内容(同时后台刷新)的时长(秒)
+fetch_cache_max_stale = 86400
+# 订阅缓存最大占用字节数，超出后按LRU淘汰
+fetch_cache_max_bytes = 64 * 1024 * 1024
+# 同一台机器上所有worker共享的本地存储(SQLite)路径，保存订阅内容、解析后的节点和渲染结果，重启后可直接使用，为空时不保存
+# 其中的订阅url和节点凭据都是敏感信息，默认放在本应用专用的目录中，目录权限0700，文件权限0600
+store_path = os.getenv('ML_SUB_STORE', os.path.join(
+    os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'ml-sub', 'ml-sub.db'))
+# 本地存储中订阅内容及节点、渲染结果分别最多占用的字节数，超出后淘汰最早写入的
+store_max_bytes = 512 * 1024 * 1024
+store_rendered_max_bytes = 512 * 1024 * 1024
+# 读写本地存储的线程数
+store_workers = 2
+
+# 后台定时刷新LINKS或resources.txt中配置的订阅
+refresh_enabled = True
+# 上游没有声明更新间隔时的刷新间隔(秒)
+refresh_default_interval = 300
+# 刷新间隔的上下限(秒)
+refresh_min_interval = 60
+refresh_max_interval = 6 * 3600
+# 刷新间隔的随机浮动比例
+refresh_jitter = 0.1
+# 同时刷新的订阅数
+refresh_concurrency = 4
+
+# 连接池：缓存连接池的host个数
+http_pool_connections = 20
+# 连接池：每个host保持的最大连接数
+http_pool_maxsize = 10
+# 连接池：连接数达到上限时是否阻塞等待
+http_pool_block = False
+# 连接超时(秒)
+http_connect_timeout = 3
+# 读取超时(秒)
+http_read_timeout = 3
+
+# 每个worker进程内渲染结果缓存的最大条目数，各worker共享的渲染结果在本地存储中
+render_cache_max_entries = 200
+# 每个worker进程内渲染结果缓存最大占用字节数
+render_cache_max_bytes = 32 * 1024 * 1024
+
+# 节点个数达到该值时，v2rayN、Surfboard、Leaf订阅改为流式返回，降低内存峰值
+stream_min_nodes = 5000
+# 流式返回时每块的大小(字符数)
+stream_chunk_size = 64 * 1024
+
+# 按Accept-Encoding压缩响应，小于该字节数的内容不压缩
+compress_min_size = 1024
+# 各编码的压缩等级：gzip为1~9，br为brotli的quality(0~11)，安装了brotli包时才使用br
+compress_levels = {'gzip': 6, 'br': 5}
+
+# 合并多个来源时的重复节点处理：first保留最先出现的，most保留字段最多的，空字符串为不去重
+dedup_policy = 'first'
+
+# 逐个节点打印加载详情的抽样比例(0~1)，0为关闭，排查问题时再打开
+node_log_sample_rate = 0
+
+# 运维人员排查某个订阅转换慢时，设置环境变量ML_SUB_PROFILE=1后，/sub请求带上profile=true即返回该次转换的采样分析结果
+enable_profile = os.getenv('ML_SUB_PROFILE') == '1'
+# 采样间隔(秒)
+profile_interval = 0.001
+# 分析结果另存到该目录，为空时只在响应中返回
+profile_dir = os.getenv('ML_SUB_PROFILE_DIR', '')
@@ -0,0 +1,43 @@
+import pytest
+
+from core.cache import matching_etag, sub_etag
+
+ETAG = '"abc"'
+
+
+@pytest.mark.parametrize('if_none_match, expected', [
+    ('"abc"', '"abc"'),
+    ('W/"abc"', '"abc"'),
+    ('"x", "abc"', '"abc"'),
+    ('"x",W/"abc" , "y"', '"abc"'),
+    ('*', ETAG),
+    # 同一内容的压缩编码表示，返回客户端持有的ETag
+    ('"abc-gzip"', '"abc-gzip"'),
+    ('W/"abc-br"', '"abc-br"'),
+])
+def test_matching_etag(if_none_match, expected):
+    assert matching_etag(if_none_match, ETAG) == expected
+
+
+@pytest.mark.parametrize('if_none_match', [None, '', '"abcd"', '"ab"', 'abc', '"abc-deflate"', '"x", "y"'])
+def test_matching_etag_no_match(if_none_match):
+    assert matching_etag(if_none_match, ETAG) is None
+
+
+def test_matching_etag_without_etag():
+    assert matching_etag('*', None) is None
+
+
+def test_sub_etag_without_providers_is_key():
+    assert sub_etag('k') == '"k"'
+    assert sub_etag('k', {}) == '"k"'
+
+
+def test_sub_etag_depends_on_provider_fingerprints():
+    providers = {'http://a': (3600, 'fa'), 'http://b': (None, 'fb')}
+    etag = sub_etag('k', providers)
+    assert etag.startswith('"p-') and etag != sub_etag('k')
+    # 与provider的顺序和interval无关
+    assert sub_etag('k', {'http://b': (60, 'fb'), 'http://a': (3600, 'fa')}) == etag
+    assert sub_etag('k', {'http://a': (3600, 'fa'), 'http://b': (None, 'changed')}) != etag
+    assert sub_etag('other', providers) != etag
@@ -0,0 +1,74 @@
+import gzip
+
+import pytest
+
+from core import compress
+from core.compress import BROTLI, GZIP
+
+
+@pytest.fixture
+def both(monkeypatch):
+    # negotiate不调用brotli，未安装时也可按同时支持两种编码测试
+    monkeypatch.setattr(compress, 'ENCODINGS', (BROTLI, GZIP))
+    return (BROTLI, GZIP)
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    (None, None),
+    ('', None),
+    ('identity', None),
+    ('deflate', None),
+    ('gzip', GZIP),
+    ('GZIP ; q=0.9, deflate', GZIP),
+    ('br', BROTLI),
+    ('gzip, br', BROTLI),
+    # q值相同时按ENCODINGS的顺序
+    ('br;q=0.5, gzip;q=0.5', BROTLI),
+    ('br;q=0.5, gzip', GZIP),
+    ('gzip;q=0, br;q=0', None),
+    ('br;q=0, *', GZIP),
+    ('*', BROTLI),
+    ('*;q=0.1, gzip;q=0', BROTLI),
+    ('*;q=0', None),
+    ('gzip;q=abc, br;q=0.1', BROTLI),
+    ('gzip;level=1;q=0.8', GZIP),
+])
+def test_negotiate(both, accept_encoding, expected):
+    assert compress.negotiate(accept_encoding, both) == expected
+
+
+def test_negotiate_limited_to_available(both):
+    assert compress.negotiate('br, gzip;q=0.1', [GZIP]) == GZIP
+    assert compress.negotiate('br', [GZIP]) is None
+    assert compress.negotiate('gzip', {}) is None
+
+
+def test_encoded_etag_round_trip():
+    assert compress.encoded_etag('"abc"', None) == '"abc"'
+    for encoding in (GZIP, BROTLI):
+        etag = compress.encoded_etag('"abc"', encoding)
+        assert etag == f'"abc-{encoding}"'
+        assert compress.base_etag(etag) == '"abc"'
+    assert compress.base_etag('"abc"') == '"abc"'
+    assert compress.base_etag('"abc-deflate"') == '"abc-deflate"'
+
+
+def test_compress_all_min_size():
+    assert compress.compress_all(b'short', min_size=1024) == {}
+    data = '香港节点\n'.encode('utf-8') * 1000
+    encoded = compress.compress_all(data, min_size=1024)
+    assert set(encoded) == set(compress.ENCODINGS)
+    assert gzip.decompress(encoded[GZIP]) == data
+    # mtime固定，相同内容压缩结果相同，可在各worker间共享
+    assert compress.compress_all(data)[GZIP] == encoded[GZIP]
+
+
+def test_compress_stream_gzip():
+    parts = ['香港节点-{}\n'.format(i) for i in range(2000)]
+    assert gzip.decompress(b''.join(compress.compress_stream(iter(parts), GZIP))) == ''.join(parts).encode('utf-8')
+
+
+def test_compress_stream_brotli():
+    brotli = pytest.importorskip('brotli')
+    parts = ['香港节点-{}\n'.format(i) for i in range(2000)]
+    assert brotli.decompress(b''.join(compress.compress_stream(iter(parts), BROTLI))) == ''.join(parts).encode('utf-8')
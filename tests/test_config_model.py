@@ -0,0 +1,21 @@
+from loguru import logger
+
+from core.config_model import ProxyNode
+from core.stats import INSECURE_FLAG, MALFORMED_PORT, PARSED, UNKNOWN_PARAM, ParseStats
+
+logger.remove()
+
+
+def test_link_issues_are_counted_not_logged():
+    stats = ParseStats()
+    messages = []
+    handler = logger.add(messages.append, level='INFO')
+    try:
+        for i in range(10):
+            assert ProxyNode().load(f'trojan://p@h{i}.com:443/?allowInsecure=0&foo=1#n', stats)
+            assert ProxyNode().load(f'vless://u@v{i}.com:443?type=ws&fp=chrome&pbk=x#n', stats)
+    finally:
+        logger.remove(handler)
+    assert messages == []
+    assert stats.counts[PARSED] == 20
+    assert stats.issues == {UNKNOWN_PARAM: 30, INSECURE_FLAG: 10, MALFORMED_PORT: 10}
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+from loguru import logger
+
+from benchmarks import corpus
+from core.converter import STREAM_CLIENTS, generate_sub_stream, sub_2_nodelist
+from core.helper import base64_encode, iter_chunks
+
+logger.remove()
+
+
+@pytest.fixture(scope='module')
+def nodes():
+    return sub_2_nodelist(corpus.v2_sub(200))
+
+
+def test_v2rayn_stream_matches_buffered_base64(nodes):
+    # 修改为流式生成之前，v2rayN订阅为整体拼接后一次base64编码
+    links = [i.generate_v2rayn_link() for i in sorted(nodes, key=lambda x: x.protocol)]
+    expected = base64_encode(os.linesep.join(i for i in links if i))
+    assert ''.join(generate_sub_stream(nodes, 'v2rayN')) == expected
+
+
+@pytest.mark.parametrize('client', STREAM_CLIENTS)
+@pytest.mark.parametrize('chunk_size', [1, 1000, 64 * 1024])
+def test_chunked_stream_matches_whole(nodes, client, chunk_size):
+    whole = ''.join(generate_sub_stream(nodes, client))
+    assert ''.join(iter_chunks(generate_sub_stream(nodes, client), chunk_size)) == whole
+
+
+def test_stream_does_not_reorder_input(nodes):
+    shuffled = nodes[::-1]
+    before = list(shuffled)
+    ''.join(generate_sub_stream(shuffled, 'Leaf'))
+    assert shuffled == before
+
+
+def test_bad_vmess_payloads_are_decoded_once(monkeypatch):
+    from core import config_model
+    from core.stats import INVALID, PARSED, ParseStats
+
+    calls = []
+    decode = config_model.base64_decode_bytes
+    monkeypatch.setattr(config_model, 'base64_decode_bytes', lambda i: calls.append(i) or decode(i))
+
+    bad = [base64_encode('{"ps":"A"},{"ps":"B"'), base64_encode('"add":"x.com"}'), '!!!', base64_encode('[1]')]
+    good = corpus.links(3, 'vmess')
+    stats = ParseStats()
+    nodes = sub_2_nodelist(base64_encode('\n'.join(good + ['vmess://' + i for i in bad])), stats)
+
+    assert len(nodes) == 3
+    assert stats.counts[PARSED] == 3 and stats.counts[INVALID] == len(bad)
+    assert len(calls) == len(good) + len(bad)
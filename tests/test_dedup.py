@@ -0,0 +1,50 @@
+import base64
+import json
+
+from loguru import logger
+
+from core.config_model import ProxyNode
+from core.dedup import KEEP_FIRST, NodeIndex, node_key
+
+logger.remove()
+
+
+def _vmess_link(**fields):
+    config = {'v': '2', 'ps': 'link', 'add': 'Node.Example.com', 'port': '443', 'id': 'uuid-1', 'aid': '0',
+              'net': 'tcp', 'type': 'none', 'host': '', 'path': '', 'tls': ''}
+    config.update(fields)
+    return 'vmess://' + base64.b64encode(json.dumps(config).encode('utf-8')).decode('ascii')
+
+
+def _load(proxy):
+    node = ProxyNode()
+    assert node.load(proxy)
+    return node
+
+
+def test_vmess_link_and_clash_entry_are_the_same_node():
+    link = _load(_vmess_link())
+    clash = _load({'name': 'clash', 'type': 'vmess', 'server': 'node.example.com', 'port': 443, 'uuid': 'uuid-1',
+                   'alterId': 0, 'cipher': 'auto'})
+    assert node_key(link) == node_key(clash)
+
+    index = NodeIndex(KEEP_FIRST)
+    index.extend([link, clash])
+    assert index.nodes == [link] and index.dropped == 1
+
+
+def test_ws_vmess_link_and_clash_entry_are_the_same_node():
+    link = _load(_vmess_link(net='ws', host='cdn.example.com', path='/ws', tls='tls', scy='auto'))
+    clash = _load({'name': 'clash', 'type': 'vmess', 'server': 'node.example.com', 'port': '443', 'uuid': 'uuid-1',
+                   'alterId': '0', 'cipher': 'auto', 'tls': True, 'network': 'ws',
+                   'ws-opts': {'path': '/ws', 'headers': {'Host': 'cdn.example.com'}}})
+    assert node_key(link) == node_key(clash)
+
+
+def test_different_servers_are_kept():
+    base = _load(_vmess_link())
+    assert node_key(base) != node_key(_load(_vmess_link(id='uuid-2')))
+    assert node_key(base) != node_key(_load(_vmess_link(port='444')))
+    assert node_key(base) != node_key(_load(_vmess_link(scy='aes-128-gcm')))
+    # tcp的http伪装带有host时与不伪装不同
+    assert node_key(base) != node_key(_load(_vmess_link(host='obfs.example.com')))
@@ -0,0 +1,35 @@
+import pytest
+
+from core.helper import base64_encode, base64_encode_stream, iter_chunks
+
+TEXT = 'ss://YWVz@1.2.3.4:443#🇭🇰 香港节点-01\nvmess://eyJ2IjoiMiJ9\ntrojan://p@h:443#日本'
+
+
+def _splits(text):
+    # 在每个位置切分，覆盖多字节字符被拆开、各部分长度与3不对齐的情况
+    for i in range(len(text) + 1):
+        yield [text[:i], text[i:]]
+    for size in (1, 2, 4, 5, 7):
+        yield [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize('parts', list(_splits(TEXT)))
+def test_base64_encode_stream_matches_buffered(parts):
+    assert ''.join(base64_encode_stream(parts)) == base64_encode(''.join(parts))
+
+
+def test_base64_encode_stream_empty_parts():
+    assert ''.join(base64_encode_stream([])) == ''
+    assert ''.join(base64_encode_stream(['', '香', '', '港', ''])) == base64_encode('香港')
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 10, 1000])
+def test_iter_chunks_preserves_content(chunk_size):
+    parts = [TEXT[i:i + 3] for i in range(0, len(TEXT), 3)]
+    chunks = list(iter_chunks(parts, chunk_size))
+    assert ''.join(chunks) == TEXT
+    assert all(len(i) >= chunk_size for i in chunks[:-1])
+
+
+def test_iter_chunks_empty():
+    assert list(iter_chunks([], 10)) == []
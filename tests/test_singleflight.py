@@ -0,0 +1,126 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import pytest
+
+from core.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def _start_leader(sf, executor, key, func):
+    # 等待leader开始执行，保证之后的调用都是follower
+    started = threading.Event()
+
+    def leader():
+        started.set()
+        return func()
+
+    future = executor.submit(sf.do, key, leader)
+    started.wait(1)
+    return future
+
+
+def test_followers_share_leader_result():
+    sf, release, calls = SingleFlight(), threading.Event(), []
+
+    def func():
+        calls.append(1)
+        release.wait(1)
+        return 'result'
+
+    with ThreadPoolExecutor(4) as executor:
+        leader = _start_leader(sf, executor, 'k', func)
+        followers = [executor.submit(sf.do, 'k', func) for _ in range(3)]
+        release.set()
+        assert leader.result() == 'result'
+        assert [i.result() for i in followers] == ['result'] * 3
+    assert len(calls) == 1
+
+
+def test_follower_receives_leader_exception_and_key_is_removed():
+    sf, release = SingleFlight(), threading.Event()
+
+    def fail():
+        release.wait(1)
+        raise ValueError('boom')
+
+    with ThreadPoolExecutor(2) as executor:
+        leader = _start_leader(sf, executor, 'k', fail)
+        follower = executor.submit(sf.do, 'k', fail)
+        release.set()
+        with pytest.raises(ValueError):
+            leader.result()
+        with pytest.raises(ValueError):
+            follower.result()
+
+    # 出错后不保留结果，再次调用会重新执行
+    assert sf.do('k', lambda: 'again') == 'again'
+
+
+def test_follower_timeout():
+    sf, release = SingleFlight(), threading.Event()
+
+    with ThreadPoolExecutor(1) as executor:
+        leader = _start_leader(sf, executor, 'k', lambda: release.wait(1) and 'result')
+        with pytest.raises(TimeoutError):
+            sf.do('k', lambda: 'follower', timeout=0.01)
+        release.set()
+        assert leader.result() == 'result'
+
+
+def test_async_callers_share_one_execution():
+    async def run():
+        sf, calls = AsyncSingleFlight(), []
+
+        async def func():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'result'
+
+        results = await asyncio.gather(*(sf.do('k', func) for _ in range(5)))
+        return results, calls, 'k' in sf
+
+    results, calls, inflight = asyncio.run(run())
+    assert results == ['result'] * 5
+    assert len(calls) == 1
+    assert not inflight
+
+
+def test_async_follower_timeout_does_not_cancel_shared_task():
+    async def run():
+        sf = AsyncSingleFlight()
+
+        async def func():
+            await asyncio.sleep(0.05)
+            return 'result'
+
+        waiting = asyncio.ensure_future(sf.do('k', func))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.TimeoutError):
+            await sf.do('k', func, timeout=0.01)
+        return await waiting
+
+    assert asyncio.run(run()) == 'result'
+
+
+def test_async_follower_receives_exception_and_key_is_removed():
+    async def run():
+        sf = AsyncSingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError('boom')
+
+        results = await asyncio.gather(sf.do('k', fail), sf.do('k', fail), return_exceptions=True)
+        # 让task的完成回调执行
+        await asyncio.sleep(0)
+
+        async def ok():
+            return 'again'
+
+        return results, 'k' in sf, await sf.do('k', ok)
+
+    results, inflight, again = asyncio.run(run())
+    assert all(isinstance(i, ValueError) for i in results)
+    assert not inflight
+    assert again == 'again'